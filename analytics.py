@@ -0,0 +1,65 @@
+from datetime import timedelta
+from database import DB_NAME, get_connection, cached, user_today
+from metrics import instrument_module
+
+# Öntözési statisztikák a watering_stats és watering_weekly összesítő táblákból
+# (lásd database.ROLLUP_STATS_SQL). Ezek minden öntözéskor frissülnek, ezért a
+# lekérdezések a felhasználó növényeinek számával arányosak, nem a napló hosszával.
+# Kötegelt feldolgozáshoz (sok felhasználó egymás után) a db_name egy pillanatkép is
+# lehet (database.open_snapshot), így az olvasások nem az élő fájlon futnak; a day
+# paraméter nélkül a felhasználó időzónáját is onnan olvassák.
+
+@cached("plants", "watering_logs")
+def get_plant_stats(username, day=None, db_name=DB_NAME):
+    # Növényenként: (id, name, tervezett gyakoriság, öntözések száma, átlagos tényleges
+    # intervallum napokban vagy None, összes késés napokban, most késésben lévő napok,
+    # aktuális sorozat, leghosszabb sorozat)
+    today = (day or user_today(username, db_name)).strftime("%Y-%m-%d")
+    with get_connection(db_name) as conn:
+        return conn.execute("""
+            SELECT p.id, p.name, p.frequency_days,
+                   COALESCE(s.waterings, 0),
+                   round(1.0 * s.interval_days / NULLIF(s.interval_count, 0), 1),
+                   COALESCE(s.overdue_days, 0),
+                   max(CAST(julianday(:today) - julianday(p.next_due) AS INTEGER), 0),
+                   COALESCE(s.streak, 0),
+                   COALESCE(s.best_streak, 0)
+            FROM plants p
+            LEFT JOIN watering_stats s ON s.plant_id = p.id
+            WHERE p.username = :username
+            ORDER BY p.name
+        """, {"username": username, "today": today}).fetchall()
+
+@cached("plants", "watering_logs")
+def get_user_stats(username, db_name=DB_NAME):
+    # A felhasználó összesített adatai: növények, öntözések, átlagos tényleges és tervezett
+    # intervallum, összes késés napokban, leghosszabb sorozat
+    with get_connection(db_name) as conn:
+        return conn.execute("""
+            SELECT COUNT(p.id),
+                   COALESCE(SUM(s.waterings), 0),
+                   round(1.0 * SUM(s.interval_days) / NULLIF(SUM(s.interval_count), 0), 1),
+                   round(AVG(p.frequency_days), 1),
+                   COALESCE(SUM(s.overdue_days), 0),
+                   COALESCE(MAX(s.best_streak), 0)
+            FROM plants p
+            LEFT JOIN watering_stats s ON s.plant_id = p.id
+            WHERE p.username = ?
+        """, (username,)).fetchone()
+
+@cached("plants", "watering_logs")
+def get_weekly_waterings(username, weeks=52, day=None, db_name=DB_NAME):
+    # Heti öntözésszám az utolsó `weeks` hétre: [(hét első napja, öntözések)], üres hetek nélkül
+    today = day or user_today(username, db_name)
+    since = today - timedelta(days=today.weekday() + 7 * (weeks - 1))
+    with get_connection(db_name) as conn:
+        return conn.execute("""
+            SELECT w.week_start, SUM(w.waterings)
+            FROM watering_weekly w
+            JOIN plants p ON p.id = w.plant_id
+            WHERE p.username = ? AND w.week_start >= ?
+            GROUP BY w.week_start
+            ORDER BY w.week_start
+        """, (username, since.strftime("%Y-%m-%d"))).fetchall()
+
+instrument_module(globals())
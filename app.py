@@ -1,5 +1,5 @@
 import streamlit as st
-from app_logic import init_session, show_login, show_dashboard
+from app_logic import init_session, show_login, show_dashboard, show_admin_panel
 
 # A set_page_config-nek EZ AZ ELSŐ Streamlit hívásnak kell lennie
 st.set_page_config(page_title="Plant Watering Tracker", layout="centered")
@@ -12,4 +12,5 @@ st.title("🌱 Plant Watering Tracker")
 if not st.session_state.get("authenticated"):
     show_login()
 else:
-    show_dashboard()
\ No newline at end of file
+    show_dashboard()
+    show_admin_panel()
\ No newline at end of file
@@ -1,31 +1,38 @@
 import streamlit as st
-import sqlite3
-import hashlib
-from datetime import datetime, timedelta, time
-from streamlit_cookies_manager import EncryptedCookieManager
-import smtplib
-from email.mime.multipart import MIMEMultipart
-from email.mime.text import MIMEText
-
-# Cookie manager inicializálása
-cookies = EncryptedCookieManager(prefix="planttracker_", password="egy-erős-es-minimum-16-karakteres-jelszo")
-if not cookies.ready():
-    st.stop()
-
-# SMTP email küldő függvény
-def send_email(to_emails, subject, body, sender_email, sender_password,
-               smtp_server="smtp.gmail.com", smtp_port=465):
-    msg = MIMEMultipart()
-    msg['From'] = sender_email
-    msg['To'] = ", ".join(to_emails)
-    msg['Subject'] = subject
-    msg.attach(MIMEText(body, 'plain'))
-    with smtplib.SMTP_SSL(smtp_server, smtp_port) as server:
-        server.login(sender_email, sender_password)
-        server.sendmail(sender_email, to_emails, msg.as_string())
+from itertools import groupby
+from metrics import begin_rerun, rerun_stats, snapshot, export_prometheus, start_exporter
+from database import (
+    get_connection, write_transaction, init_db, invalidate,
+    add_plant, delete_plant, update_last_watered_and_log,
+    get_plants_due_today, get_plants_page, get_upcoming_waterings,
+    water_plants, water_all_due, import_plants,
+    get_user_email, delete_user_and_plants,
+    user_today, get_user_timezone, set_user_timezone
+)
+from models import day_to_date
+
+# A nehezebb modulok (smtplib és email a mailerben, hashlib és a KDF szálkészlet a
+# passwords-ben, gzip/csv a retention-ben, a cookie komponens) csak az első használatkor
+# töltődnek be, folyamatonként egyszer. A bejelentkező oldal így nem fizeti meg a
+# dashboard indulási költségét. Mérés: python startup_profile.py
+
+# Cookie manager: folyamatonként egyszer jön létre, amint a komponens elkészült
+_cookies = None
+
+def get_cookies():
+    global _cookies
+    if _cookies is None:
+        from streamlit_cookies_manager import EncryptedCookieManager
+        cookies = EncryptedCookieManager(prefix="planttracker_", password="egy-erős-es-minimum-16-karakteres-jelszo")
+        if not cookies.ready():
+            # a komponens még nem küldte vissza a sütiket, a következő futás újra próbálja
+            st.stop()
+        _cookies = cookies
+    return _cookies
 
 # ----- SESSION KEZELÉS ÉS ADATBÁZIS FUNKCIÓK -----
 def init_session_from_cookies():
+    cookies = get_cookies()
     if cookies.get("authenticated") == "true":
         st.session_state["authenticated"] = True
         st.session_state["username"] = cookies.get("username")
@@ -36,6 +43,7 @@ def init_session_from_cookies():
 def login_user(username):
     st.session_state["authenticated"] = True
     st.session_state["username"] = username
+    cookies = get_cookies()
     cookies["authenticated"] = "true"
     cookies["username"] = username
     cookies.save()
@@ -43,6 +51,7 @@ def login_user(username):
 def logout_user():
     st.session_state["authenticated"] = False
     st.session_state["username"] = None
+    cookies = get_cookies()
     if "authenticated" in cookies:
         del cookies["authenticated"]
     if "username" in cookies:
@@ -50,62 +59,42 @@ def logout_user():
     cookies.save()
 
 def init_session():
+    begin_rerun()
     if "authenticated" not in st.session_state or "username" not in st.session_state:
         init_session_from_cookies()
-    create_users_table()
+    init_db()
+    from retention import start_scheduler
+    start_scheduler()  # heti napló archiválás és VACUUM/ANALYZE a háttérben
+    start_exporter()  # METRICS_FILE megadásakor percenként kiírja a metrikákat
 
 # ---------- ADATBÁZIS USER FUNKCIÓK ----------
-def create_users_table():
-    conn = sqlite3.connect("users.db")
-    cur = conn.cursor()
-    cur.execute("""
-        CREATE TABLE IF NOT EXISTS users (
-            id INTEGER PRIMARY KEY,
-            username TEXT UNIQUE,
-            password TEXT,
-            email TEXT
-        )
-    """)
-    conn.commit()
-    conn.close()
-
 def add_user(username, password, email=None):
+    from passwords import hash_password
     hashed_pw = hash_password(password)
-    conn = sqlite3.connect("users.db")
-    cur = conn.cursor()
-    cur.execute("INSERT INTO users (username, password, email) VALUES (?, ?, ?)", (username, hashed_pw, email))
-    conn.commit()
-    conn.close()
+    with write_transaction() as conn:
+        conn.execute("INSERT INTO users (username, password, email) VALUES (?, ?, ?)", (username, hashed_pw, email))
+    invalidate("users")
 
 def get_user(username):
-    conn = sqlite3.connect("users.db")
-    cur = conn.cursor()
-    cur.execute("SELECT * FROM users WHERE username = ?", (username,))
-    user = cur.fetchone()
-    conn.close()
-    return user
-
-def get_all_user_emails():
-    conn = sqlite3.connect("users.db")
-    cur = conn.cursor()
-    cur.execute("SELECT email FROM users WHERE email IS NOT NULL AND email != ''")
-    emails = [row[0] for row in cur.fetchall()]
-    conn.close()
-    return emails
+    with get_connection() as conn:
+        return conn.execute("SELECT * FROM users WHERE username = ?", (username,)).fetchone()
 
-# ---------- SEGÉDFÜGGVÉNYEK ----------
-def hash_password(password):
-    return hashlib.sha256(password.encode()).hexdigest()
+def update_password_hash(username, password):
+    from passwords import hash_password
+    hashed_pw = hash_password(password)
+    with write_transaction() as conn:
+        conn.execute("UPDATE users SET password = ? WHERE username = ?", (hashed_pw, username))
 
-def verify_password(input_password, stored_password):
-    return hash_password(input_password) == stored_password
+# ---------- SEGÉDFÜGGVÉNYEK ----------
+_timezone_names = None
 
-def watered_today(plant):
-    last_watered_str = plant[4]  # last_watered mező
-    if not last_watered_str:
-        return False
-    last_watered_date = datetime.strptime(last_watered_str, "%Y-%m-%d").date()
-    return last_watered_date == datetime.now().date()
+def timezone_names():
+    # Az elérhető IANA időzónák (a tzdata könyvtár bejárása, ezért folyamatonként egyszer)
+    global _timezone_names
+    if _timezone_names is None:
+        from zoneinfo import available_timezones
+        _timezone_names = sorted(available_timezones())
+    return _timezone_names
 
 # def send_watering_reminder_if_needed():
 #     now = datetime.now()
@@ -156,31 +145,92 @@ def watered_today(plant):
 #         sender_password=sender_password
 #     )
 
-def send_watering_reminder_if_needed():
-    # figyelmen kívül hagyja az idő és öntözött állapot vizsgálatot, minden növény öntözendőnek veszi
-    from database import get_all_plants
-    plants = get_all_plants()
+# ---------- STATISZTIKÁK ----------
+def show_watering_stats(username, today):
+    from analytics import get_plant_stats, get_user_stats, get_weekly_waterings
 
-    emails = get_all_user_emails()
-    if not emails:
+    plants, waterings, actual, planned, overdue, best_streak = get_user_stats(username)
+    if not waterings:
+        st.info("Még nincs öntözési adat.")
         return
 
-    body_lines = ["Teszt: minden növény öntözendőnek van jelölve."]
-    for p in plants:
-        body_lines.append(f"- {p[2]} (tulajdonos: {p[1]})")
-    body = "\n".join(body_lines)
-    subject = "Teszt növény öntözési értesítő"
+    metric_cols = st.columns(4)
+    metric_cols[0].metric("Öntözések", waterings)
+    metric_cols[1].metric("Átlagos intervallum", f"{actual or '-'} nap", help=f"Tervezett átlag: {planned} nap")
+    metric_cols[2].metric("Összes késés", f"{overdue} nap")
+    metric_cols[3].metric("Leghosszabb sorozat", best_streak)
+
+    weekly = get_weekly_waterings(username, day=today)
+    if weekly:
+        st.caption("Öntözések hetente (utolsó 52 hét)")
+        st.bar_chart({"Öntözések": {week: count for week, count in weekly}})
+
+    st.dataframe(
+        [
+            {
+                "Növény": name,
+                "Tervezett (nap)": frequency,
+                "Tényleges átlag (nap)": avg_interval,
+                "Öntözések": count,
+                "Késés összesen (nap)": overdue_days,
+                "Most késik (nap)": late_now,
+                "Sorozat": streak,
+                "Legjobb sorozat": best,
+            }
+            for _, name, frequency, count, avg_interval, overdue_days, late_now, streak, best
+            in get_plant_stats(username, today)
+        ],
+        hide_index=True,
+    )
 
-    sender_email = st.secrets["email"]["address"]
-    sender_password = st.secrets["email"]["password"]
+# ---------- ADMIN: TELJESÍTMÉNY ----------
+def is_admin(username):
+    # .streamlit/secrets.toml: admin_users = ["felhasznalonev"]
+    return username in st.secrets.get("admin_users", [])
 
-    send_email(
-        to_emails=emails,
-        subject=subject,
-        body=body,
-        sender_email=sender_email,
-        sender_password=sender_password
-    )
+def _ms(seconds):
+    return None if seconds is None else round(seconds * 1000, 2)
+
+def show_admin_panel():
+    # Az app.py a dashboard után hívja, így a táblázat a teljes újrafuttatást mutatja
+    if not is_admin(st.session_state.get("username")):
+        return
+    stats = rerun_stats()
+    with st.expander("🛠️ Teljesítmény (admin)"):
+        if stats:
+            elapsed, instrumented, functions = stats
+            cols = st.columns(3)
+            cols[0].metric("Újrafuttatás", f"{elapsed * 1000:.0f} ms")
+            cols[1].metric("Adatbázis / SMTP", f"{instrumented * 1000:.0f} ms")
+            cols[2].metric("Renderelés és egyéb", f"{(elapsed - instrumented) * 1000:.0f} ms")
+            st.caption("Ebben az újrafuttatásban")
+            st.dataframe(
+                [
+                    {"függvény": name, "hívások": calls, "ms": _ms(seconds), "sorok": rows}
+                    for name, (calls, seconds, rows) in sorted(functions.items(), key=lambda f: -f[1][1])
+                ],
+                hide_index=True,
+            )
+        st.caption("A folyamat indulása óta (p50 / p95: a hisztogram vödrének felső határa)")
+        st.dataframe(
+            [
+                {"függvény": name, "hívások": calls, "hibák": errors,
+                 "átlag ms": _ms(seconds / calls), "p50 ms": _ms(p50), "p95 ms": _ms(p95), "sorok": rows}
+                for name, (calls, errors, seconds, rows, p50, p95) in snapshot().items()
+            ],
+            hide_index=True,
+        )
+        st.download_button("Prometheus export", export_prometheus(),
+                           file_name="planttracker.prom", mime="text/plain")
+
+# ---------- NÖVÉNYLISTA LAPOZÁS ----------
+PAGE_SIZES = [10, 20, 50, 100]
+# Ennyi napra előre mutatjuk a naptárat
+UPCOMING_DAYS = 7
+PLANT_SORT_LABELS = {
+    "Hozzáadás sorrendje": "id",
+    "Következő öntözés": "next_due",
+}
 
 # ---------- BEJELENTKEZÉS ÉS REGISZTRÁCIÓ ----------
 def show_login():
@@ -191,8 +241,12 @@ def show_login():
         username = st.text_input("Felhasználónév", key="login_user")
         password = st.text_input("Jelszó", type="password", key="login_pass")
         if st.button("Bejelentkezés"):
+            from passwords import verify_password, needs_rehash
             user = get_user(username)
             if user and verify_password(password, user[2]):
+                if needs_rehash(user[2]):
+                    # régi (sózatlan SHA-256 vagy gyengébb költségű) hash cseréje az aktuálisra
+                    update_password_hash(username, password)
                 login_user(username)
                 st.success(f"Szia, {username}! Sikeresen bejelentkeztél.")
                 st.rerun()
@@ -214,41 +268,29 @@ def show_login():
                 st.warning("Kérlek, töltsd ki az összes mezőt.")
 
 def show_dashboard():
-    from database import (
-        create_plant_table, create_watering_logs_table,
-        add_plant, get_all_plants,
-        delete_plant, update_last_watered_and_log,
-        get_plants_due_today, get_last_watering_info,
-        get_user_email, delete_user_and_plants
-    )
-    import smtplib
-    from email.mime.text import MIMEText
+    from mailer import start_worker, send_email
+    from due_scheduler import start_reminders
 
-    create_plant_table()
-    create_watering_logs_table()
+    sender_email = st.secrets["email"]["address"]
+    sender_password = st.secrets["email"]["password"]
 
-    send_watering_reminder_if_needed()  # az email értesítés ellenőrzése
+    start_worker(sender_email, sender_password)
+    start_reminders()  # esedékességkor sorba állítja az értesítőt, a küldés háttérben történik
 
     st.success(f"Bejelentkezve: {st.session_state['username']}")
     st.header("Növénykezelő Felület")
 
     username = st.session_state["username"]
     user_email = get_user_email(username)
-    sender_email = st.secrets["email"]["address"]
-    sender_password = st.secrets["email"]["password"]
 
     def send_test_email():
         if not user_email:
             st.error("Az email címed nincs megadva, nem lehet teszt emailt küldeni.")
             return
-        msg = MIMEText("Ez egy teszt email a Plant Watering Tracker appból.")
-        msg['Subject'] = "Teszt Email"
-        msg['From'] = sender_email
-        msg['To'] = user_email
         try:
-            with smtplib.SMTP_SSL("smtp.gmail.com", 465) as server:
-                server.login(sender_email, sender_password)
-                server.send_message(msg)
+            send_email([user_email], "Teszt Email",
+                       "Ez egy teszt email a Plant Watering Tracker appból.",
+                       sender_email, sender_password)
             st.success(f"Teszt email elküldve a(z) {user_email} címre.")
         except Exception as e:
             st.error(f"Hiba történt a teszt email küldésekor: {e}")
@@ -256,6 +298,18 @@ def show_dashboard():
     if st.button("Teszt Email küldése"):
         send_test_email()
 
+    st.markdown("---")
+    st.subheader("Időzóna")
+    current_timezone = get_user_timezone(username)
+    zones = timezone_names()
+    new_timezone = st.selectbox("A napok és az értesítők ideje ebben az időzónában számít", zones,
+                                index=zones.index(current_timezone) if current_timezone in zones else 0,
+                                key="user_timezone")
+    if new_timezone != current_timezone and st.button("Időzóna mentése"):
+        set_user_timezone(username, new_timezone)
+        st.success(f"Időzóna beállítva: {new_timezone}")
+        st.rerun()
+
     st.markdown("---")
     st.subheader("Profil törlése")
     confirm_del = st.checkbox("Biztos vagyok benne, hogy törlöm a profilomat és az összes növényemet")
@@ -268,16 +322,31 @@ def show_dashboard():
         else:
             st.warning("Kérlek, erősítsd meg a profil törlését az előző jelölőnégyzettel!")
 
+    # A felhasználó helyi napja; a lekérdezések ezzel a nappal kerülnek a cache-be, így
+    # helyi éjfélkor a szerver órájától függetlenül frissülnek
+    today = user_today(username)
+
     # Öntözendő növények listája
-    due_today_plants = get_plants_due_today(username)
+    due_today_plants = get_plants_due_today(username, today)
     if due_today_plants:
         st.markdown("### ⚠️ Ma öntözendő növényeid:")
         for plant in due_today_plants:
-            st.write(f"🌿 **{plant[2]}** (utoljára öntözve: {plant[4]})")
+            st.write(f"🌿 **{plant.name}** (utoljára öntözve: {plant.last_watered_date})")
+        if st.button("💧 Mindet megöntöztem", key="water_all_due"):
+            count = water_all_due(username)
+            st.success(f"{count} növény öntözve.")
+            st.rerun()
         st.markdown("---")
     else:
         st.info("Ma egy növényt sem kell öntözni. Szép napot! 🌞")
 
+    # A következő napok öntözései az előre kiszámolt naptárból
+    upcoming = get_upcoming_waterings(username, UPCOMING_DAYS, today)
+    if upcoming:
+        with st.expander(f"📅 A következő {UPCOMING_DAYS} nap öntözései"):
+            for day, items in groupby(upcoming, key=lambda item: item[0]):
+                st.write(f"**{day_to_date(day)}**: " + ", ".join(plant.name for _, plant in items))
+
     with st.expander("Új növény hozzáadása"):
         with st.form("add_plant_form"):
             plant_name = st.text_input("Növény neve", key="new_plant_name")
@@ -291,56 +360,99 @@ def show_dashboard():
                     st.success(f"Hozzáadva: {plant_name.strip()}")
                     st.rerun()
 
-    plants = get_all_plants()
-    if not plants:
-        st.info("Nincs még növény a rendszerben.")
-        return
+    with st.expander("Növények importálása (CSV / JSON)"):
+        st.caption("Oszlopok / kulcsok: name, frequency_days, last_watered (opcionális, ÉÉÉÉ-HH-NN)")
+        uploaded = st.file_uploader("Fájl kiválasztása", type=["csv", "json"], key="plant_import_file")
+        if uploaded is not None and st.button("Importálás"):
+            from plant_import import read_plants
+            try:
+                rows = read_plants(uploaded.name, uploaded.getvalue().decode("utf-8-sig"))
+            except (ValueError, UnicodeDecodeError) as e:
+                st.error(f"Az import nem sikerült: {e}")
+            else:
+                count = import_plants(username, rows)
+                st.success(f"{count} növény importálva.")
+                st.rerun()
 
-    plants_list = [
-        {
-            "id": p[0],
-            "username": p[1],
-            "name": p[2],
-            "frequency_days": p[3],
-            "last_watered": p[4],
-        }
-        for p in plants
-    ]
+    with st.expander("📊 Öntözési statisztikák"):
+        show_watering_stats(username, today)
 
     st.subheader("Növényeid")
-    for plant in plants_list:
-        plant_id = plant["id"]
-        due = plant_id in [p[0] for p in get_plants_due_today(username)]
-        last_watering = get_last_watering_info(plant_id)
-        if last_watering:
-            watered_by, watered_at = last_watering
+    filter_cols = st.columns([3,2,1])
+    with filter_cols[0]:
+        search = st.text_input("Keresés név szerint", key="plant_search").strip()
+    with filter_cols[1]:
+        sort_label = st.selectbox("Rendezés", list(PLANT_SORT_LABELS), key="plant_sort")
+    with filter_cols[2]:
+        page_size = st.selectbox("Oldalméret", PAGE_SIZES, index=1, key="plant_page_size")
+
+    # Lapozási állapot: az eddig megnyitott oldalak kezdő kulcsai (keyset kurzorok).
+    # Keresés, rendezés vagy oldalméret változásakor az első oldalról indulunk újra.
+    view = (search, sort_label, page_size)
+    if st.session_state.get("plant_view") != view:
+        st.session_state["plant_view"] = view
+        st.session_state["plant_cursors"] = [None]
+    cursors = st.session_state["plant_cursors"]
+
+    # Egy lekérdezéssel töltjük be az oldal növényeit, az esedékességet és az utolsó öntözést
+    plants, next_after = get_plants_page(
+        username, page_size, cursors[-1], PLANT_SORT_LABELS[sort_label], search or None, today
+    )
+    if not plants:
+        if search:
+            st.info("Nincs a keresésnek megfelelő növény.")
         else:
-            watered_by, watered_at = "Ismeretlen", "Nincs adat"
+            st.info("Nincs még növény a rendszerben.")
+        return
+
+    for plant in plants:
+        plant_id = plant.id
+        watered_by = plant.last_log.watered_by if plant.last_log else None
 
         cols = st.columns([3,2,2,2,2,2])
         with cols[0]:
-            st.write(f"🌿 **{plant['name']}**")
+            st.write(f"🌿 **{plant.name}**")
         with cols[1]:
-            st.write(f"Minden {plant['frequency_days']} nap")
+            st.write(f"Minden {plant.frequency_days} nap")
         with cols[2]:
-            st.write(f"Utolsó öntözés: {plant['last_watered']}")
+            st.write(f"Utolsó öntözés: {plant.last_watered_date}")
         with cols[3]:
-            if due:
+            if plant.due:
                 st.markdown("**⚠️ Öntözni kell!**")
             else:
                 st.markdown("✅ Rendben van")
         with cols[4]:
-            st.write(f"Utolsó öntöző: **{watered_by}**")
+            st.write(f"Utolsó öntöző: **{watered_by or 'Ismeretlen'}**")
         with cols[5]:
             if st.button("🗑️", key=f"del_{plant_id}"):
                 delete_plant(plant_id, None)
-                st.success(f"Törölve: {plant['name']}")
+                st.success(f"Törölve: {plant.name}")
                 st.rerun()
             if st.button("💧", key=f"water_{plant_id}"):
                 update_last_watered_and_log(plant_id, username)
-                st.success(f"Öntözve: {plant['name']}")
+                st.success(f"Öntözve: {plant.name}")
                 st.rerun()
 
+    # Tömeges öntözés az aktuális oldalon kiválasztott növényekre
+    names = {plant.id: plant.name for plant in plants}
+    selected = st.multiselect("Kiválasztott növények", list(names), format_func=names.get, key="water_selection")
+    if st.button("💧 Kiválasztottak öntözése", disabled=not selected):
+        count = water_plants(selected, username)
+        st.success(f"{count} növény öntözve.")
+        st.rerun()
+
+    nav_cols = st.columns([1,2,1])
+    with nav_cols[0]:
+        if st.button("◀ Előző", disabled=len(cursors) == 1):
+            cursors.pop()
+            st.rerun()
+    with nav_cols[1]:
+        st.write(f"{len(cursors)}. oldal")
+    with nav_cols[2]:
+        if st.button("Következő ▶", disabled=next_after is None):
+            cursors.append(next_after)
+            st.rerun()
+
     if st.button("Kijelentkezés"):
         logout_user()
         st.rerun()
\ No newline at end of file
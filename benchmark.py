@@ -0,0 +1,247 @@
+import argparse
+import hashlib
+import json
+import os
+import random
+import sys
+from datetime import date, timedelta
+from time import perf_counter
+
+import database
+from database import migrate, write_transaction, close_all_connections, clear_cache
+from smtp_sink import SmtpSink
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+
+# Teljesítménymérés szintetikus adatokon a forró útvonalakra:
+#   python benchmark.py                              (10k növény, 1 év napló)
+#   python benchmark.py --scale 10k 100k --save eredmeny.json
+#   python benchmark.py --scale 100k --compare eredmeny.json   (lassulásnál 1-es kilépési kód)
+# Minden méret saját könyvtárba kerül (bench/<méret>/plants.db), a függvények a
+# relatív DB_NAME-et innen nyitják meg. 1 év napló növényenként ~50 bejegyzés,
+# a 1m méretnél érdemes a --years értékét csökkenteni.
+
+# méret -> (felhasználók, növény felhasználónként)
+SCALES = {
+    "10k": (1000, 10),
+    "100k": (10000, 10),
+    "1m": (100000, 10),
+}
+SAMPLE_SIZE = 200
+
+# ---------- ADATGENERÁTOR ----------
+
+def _plants(rng, users, plants_per_user, today):
+    plant_id = 0
+    for user in range(users):
+        for i in range(plants_per_user):
+            plant_id += 1
+            frequency_days = rng.randint(2, 14)
+            # kb. a növények fele ma esedékes vagy késésben van
+            last_watered = today - timedelta(days=rng.randint(0, 2 * frequency_days))
+            yield (plant_id, f"user{user}", f"Növény {i}", frequency_days,
+                   last_watered.isoformat(), (last_watered + timedelta(days=frequency_days)).isoformat())
+
+def _logs(rng, plants, since):
+    # Növényenként a gyakoriság szerinti, pár napos csúszással rögzített öntözések
+    for plant_id, username, _, frequency_days, last_watered, _ in plants:
+        day = since + timedelta(days=rng.randint(0, frequency_days))
+        last = date.fromisoformat(last_watered)
+        while day < last:
+            yield plant_id, username, f"{day.isoformat()} {rng.randint(6, 21):02d}:{rng.randint(0, 59):02d}:00"
+            day += timedelta(days=max(1, frequency_days + rng.randint(-1, 2)))
+        yield plant_id, username, f"{last_watered} 08:00:00"
+
+def generate(db_name, users, plants_per_user, years=1.0, seed=0):
+    # Üres adatbázist tölt fel; visszaad: (növények, napló bejegyzések)
+    rng = random.Random(seed)
+    today = date.today()
+    migrate(db_name)
+    password = hashlib.sha256(b"benchmark").hexdigest()
+    plants = list(_plants(rng, users, plants_per_user, today))
+    with write_transaction(db_name) as conn:
+        conn.executemany(
+            "INSERT INTO users (username, password, email) VALUES (?, ?, ?)",
+            ((f"user{user}", password, f"user{user}@example.com") for user in range(users)),
+        )
+        conn.executemany("""
+            INSERT INTO plants (id, username, name, frequency_days, last_watered, next_due)
+            VALUES (?, ?, ?, ?, ?, ?)
+        """, plants)
+        conn.executemany(
+            "INSERT INTO watering_logs (plant_id, watered_by, watered_at) VALUES (?, ?, ?)",
+            _logs(rng, plants, today - timedelta(days=int(365 * years))),
+        )
+        # az összesítő táblákat és a naptárat ugyanaz a kód tölti, mint a migrációban
+        database._create_rollup_tables(conn)
+        database._rebuild_calendar(conn)
+        logs = conn.execute("SELECT COUNT(*) FROM watering_logs").fetchone()[0]
+    return len(plants), logs
+
+# ---------- MÉRÉSEK ----------
+
+def _summary(timings):
+    timings = sorted(timings)
+    return {
+        "calls": len(timings),
+        "mean_ms": sum(timings) / len(timings) * 1000,
+        "p95_ms": timings[int(0.95 * (len(timings) - 1))] * 1000,
+        "max_ms": timings[-1] * 1000,
+    }
+
+def measure(func, calls, warmup=False):
+    # warmup: minden hívás előtt egy nem mért hívás ugyanazokkal az argumentumokkal
+    timings = []
+    for args in calls:
+        if warmup:
+            func(*args)
+        started = perf_counter()
+        func(*args)
+        timings.append(perf_counter() - started)
+    return _summary(timings)
+
+def load_dashboard(username):
+    # Amit a show_dashboard egy újrafuttatáskor lekérdez (az első lappal és a statisztikákkal)
+    from analytics import get_plant_stats, get_user_stats, get_weekly_waterings
+    database.get_user_email(username)
+    database.get_plants_due_today(username)
+    database.get_plants_page(username)
+    get_user_stats(username)
+    get_plant_stats(username)
+    get_weekly_waterings(username)
+
+def load_dashboard_cold(username):
+    clear_cache()
+    load_dashboard(username)
+
+def run_benchmarks(users, plant_count, sink, reminder_args):
+    rng = random.Random(1)
+    usernames = [(f"user{rng.randrange(users)}",) for _ in range(SAMPLE_SIZE)]
+    plant_ids = [(rng.randint(1, plant_count),) for _ in range(SAMPLE_SIZE)]
+
+    results = {
+        "get_plants_due_today": measure(database.get_plants_due_today.uncached, usernames),
+        "get_last_watering_info": measure(database.get_last_watering_info.uncached, plant_ids),
+        "dashboard_load_cold": measure(load_dashboard_cold, usernames),
+    }
+    # újrafuttatás ugyanazzal a felhasználóval: minden lekérdezés a read cache-ből jön
+    results["dashboard_load_cached"] = measure(load_dashboard, usernames, warmup=True)
+
+    # a send_reminder a környezeti változókat importáláskor olvassa (lásd main). A job a saját
+    # küldéseit rögzíti az outboxban, ezért a korábbi futások értesítőit töröljük: különben egy
+    # ismételt mérés ugyanazon az adatbázison egy levelet sem küldene
+    import send_reminder
+    with write_transaction() as conn:
+        conn.execute("DELETE FROM outbox WHERE dedup_key LIKE 'reminder:%'")
+    received = sink.received
+    results["send_reminder_main"] = measure(
+        send_reminder.main, [(["--force", *reminder_args],)])
+    results["send_reminder_main"]["emails"] = sink.received - received
+    return results
+
+def run_scale(name, users, plants_per_user, years, sink, reminder_args, regenerate):
+    workdir = os.path.join(BASE_DIR, "bench", name)
+    os.makedirs(workdir, exist_ok=True)
+    os.chdir(workdir)
+    close_all_connections()
+    clear_cache()
+    db_path = os.path.join(workdir, database.DB_NAME)
+    if regenerate or not os.path.exists(db_path):
+        for suffix in ("", "-wal", "-shm"):
+            if os.path.exists(db_path + suffix):
+                os.remove(db_path + suffix)
+        started = perf_counter()
+        plant_count, logs = generate(db_path, users, plants_per_user, years)
+        print(f"[{name}] generálva: {users} felhasználó, {plant_count} növény, "
+              f"{logs} napló bejegyzés ({perf_counter() - started:.1f} s)")
+    plant_count = users * plants_per_user
+    return run_benchmarks(users, plant_count, sink, reminder_args)
+
+def compare(results, baseline, tolerance):
+    # A baseline-hoz képest (1 + tolerance)-szeresnél lassabb átlagok listája
+    regressions = []
+    for scale, benchmarks in results.items():
+        for name, result in benchmarks.items():
+            before = baseline.get(scale, {}).get(name)
+            if before and result["mean_ms"] > before["mean_ms"] * (1 + tolerance):
+                regressions.append((scale, name, before["mean_ms"], result["mean_ms"]))
+    return regressions
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Teljesítménymérés szintetikus adatokon.")
+    parser.add_argument("--scale", nargs="+", choices=sorted(SCALES), default=["10k"],
+                        help="adatméret(ek): ennyi növény, felhasználónként 10")
+    parser.add_argument("--users", type=int, help="egyedi méret: felhasználók száma (a --scale helyett)")
+    parser.add_argument("--plants-per-user", type=int, default=10)
+    parser.add_argument("--years", type=float, default=1.0, help="ennyi évnyi öntözési napló")
+    parser.add_argument("--workers", type=int, default=1, help="a send_reminder --workers értéke")
+    parser.add_argument("--connections", type=int, default=1, help="a send_reminder --connections értéke")
+    parser.add_argument("--snapshot", action="store_true", help="a send_reminder pillanatképből olvasson")
+    parser.add_argument("--smtp-latency", type=float, default=0.0,
+                        help="a helyi SMTP szerver válaszideje levelenként (másodperc)")
+    parser.add_argument("--regenerate", action="store_true", help="a meglévő adatbázis újragenerálása")
+    parser.add_argument("--save", help="az eredmények mentése JSON fájlba")
+    parser.add_argument("--compare", help="összevetés egy korábban mentett JSON eredménnyel")
+    parser.add_argument("--tolerance", type=float, default=0.5,
+                        help="ennyivel (arányban) lehet lassabb az átlag a baseline-nál")
+    args = parser.parse_args(argv)
+
+    if args.users:
+        scales = {f"{args.users}x{args.plants_per_user}": (args.users, args.plants_per_user)}
+    else:
+        scales = {name: SCALES[name] for name in args.scale}
+
+    # A reminder job a helyi SMTP szervernek, korlátozás nélkül küld; a DATABASE_URL
+    # relatív, így mindig az aktuális méret könyvtárában lévő adatbázisra mutat
+    sink = SmtpSink(latency=args.smtp_latency).start()
+    os.environ.update({
+        "DATABASE_URL": database.DB_NAME,
+        "SENT_DATABASE_URL": database.DB_NAME,
+        "SMTP_SERVER": "127.0.0.1",
+        "SMTP_PORT": str(sink.port),
+        "SMTP_USE_SSL": "0",
+        "SMTP_RATE_PER_SECOND": "0",
+        "EMAIL_ADDRESS": "benchmark@example.com",
+    })
+    reminder_args = ["--workers", str(args.workers), "--connections", str(args.connections)]
+    if args.snapshot:
+        reminder_args.append("--snapshot")
+    cwd = os.getcwd()
+    results = {}
+    try:
+        for name, (users, plants_per_user) in scales.items():
+            results[name] = run_scale(name, users, plants_per_user, args.years, sink,
+                                      reminder_args, args.regenerate)
+    finally:
+        close_all_connections()
+        os.chdir(cwd)
+        sink.stop()
+
+    for name, benchmarks in results.items():
+        print(f"\n[{name}]")
+        print(f"  {'mérés':<24} {'hívás':>6} {'átlag ms':>10} {'p95 ms':>10} {'max ms':>10}")
+        for bench, r in benchmarks.items():
+            print(f"  {bench:<24} {r['calls']:>6} {r['mean_ms']:>10.2f} {r['p95_ms']:>10.2f} {r['max_ms']:>10.2f}")
+
+    # levelek nélkül a send_reminder_main ideje nem összevethető (se mentésre, se baseline-nak)
+    empty = [name for name, benchmarks in results.items() if not benchmarks["send_reminder_main"]["emails"]]
+    for name in empty:
+        print(f"HIBA [{name}] send_reminder_main: egy levél sem ment ki, a mérés nem értékelhető")
+    if empty:
+        return 1
+
+    if args.save:
+        with open(args.save, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=2)
+
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as f:
+            regressions = compare(results, json.load(f), args.tolerance)
+        for scale, bench, before, after in regressions:
+            print(f"LASSULÁS [{scale}] {bench}: {before:.2f} ms -> {after:.2f} ms")
+        if regressions:
+            return 1
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,14 +1,300 @@
+import os
 import sqlite3
-from datetime import datetime, timedelta
+import threading
+import zlib
+from collections import OrderedDict
+from contextlib import contextmanager
+from functools import lru_cache, wraps
+from itertools import groupby
+from time import monotonic, sleep
+from datetime import date, datetime, timedelta, timezone
+from zoneinfo import ZoneInfo, ZoneInfoNotFoundError
+from metrics import instrument_module, trace_statement, SLOW_QUERY_MS
+from models import Plant, WateringLog, day_to_text
 
 DB_NAME = "plants.db"
+# A felhasználók korábban külön fájlban voltak; a migráció átmásolja őket a DB_NAME-be
+LEGACY_USERS_DB_NAME = "users.db"
+
+# ---------- CONNECTION POOL ----------
+
+# Adatbázisonként legfeljebb ennyi tétlen kapcsolatot tartunk meg újrafelhasználásra
+POOL_SIZE = 8
+# Ennyi előkészített (prepared) utasítást tart meg kapcsolatonként a sqlite3 modul
+STATEMENT_CACHE_SIZE = 256
+BUSY_TIMEOUT_MS = 5000
+
+_pools = {}
+_pool_lock = threading.Lock()
+
+@lru_cache(maxsize=4096)
+def _convert_day(value):
+    # "ÉÉÉÉ-HH-NN" -> date.toordinal(); az `oszlop AS "oszlop [day]"` alakú oszlopokra fut
+    # (PARSE_COLNAMES), a NULL értékek ide sem jutnak el. Kevés különböző nap fordul elő,
+    # ezért a legtöbb érték a cache-ből jön, elemzés nélkül. Hibás érték None lesz (mint a
+    # NULL), hogy egyetlen rossz sor ne tegye használhatatlanná az összes olvasót.
+    try:
+        return date.fromisoformat(value.decode()).toordinal()
+    except ValueError:
+        return None
+
+sqlite3.register_converter("day", _convert_day)
+
+def _open_connection(db_name):
+    conn = sqlite3.connect(
+        db_name,
+        uri=db_name.startswith("file:"),  # pl. "file:teszt?mode=memory&cache=shared"
+        timeout=BUSY_TIMEOUT_MS / 1000,
+        check_same_thread=False,  # egy kapcsolatot egyszerre csak egy szál használ (lásd get_connection)
+        cached_statements=STATEMENT_CACHE_SIZE,
+        detect_types=sqlite3.PARSE_COLNAMES,
+    )
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=NORMAL")
+    conn.execute(f"PRAGMA busy_timeout={BUSY_TIMEOUT_MS}")
+    conn.execute("PRAGMA temp_store=MEMORY")
+    conn.execute("PRAGMA cache_size=-8000")
+    if SLOW_QUERY_MS is not None:
+        # lassú hívásoknál a futtatott utasítások is a naplóba kerülnek (lásd metrics.py)
+        conn.set_trace_callback(trace_statement)
+    return conn
+
+@contextmanager
+def get_connection(db_name=DB_NAME):
+    with _pool_lock:
+        pool = _pools.setdefault(db_name, [])
+        conn = pool.pop() if pool else None
+    if conn is None:
+        conn = _open_connection(db_name)
+    try:
+        yield conn
+    finally:
+        # félbemaradt tranzakció nem kerülhet vissza a poolba
+        if conn.in_transaction:
+            conn.rollback()
+        with _pool_lock:
+            if len(pool) < POOL_SIZE:
+                pool.append(conn)
+                conn = None
+        if conn is not None:
+            conn.close()
+
+# Ha a BEGIN IMMEDIATE a busy_timeout lejárta után is foglalt adatbázist talál,
+# ennyiszer próbáljuk újra exponenciálisan növekvő várakozással
+BUSY_RETRIES = 5
+BUSY_BACKOFF = 0.05
+
+def _is_busy(error):
+    message = str(error)
+    return "database is locked" in message or "database is busy" in message
+
+@contextmanager
+def write_transaction(db_name=DB_NAME):
+    # Író tranzakció: a BEGIN IMMEDIATE már az elején megszerzi az írási zárat, így
+    # SQLITE_BUSY csak itt fordulhat elő (ezt újrapróbáljuk), a tranzakció közepén nem.
+    # Hiba esetén minden módosítás visszagörgetődik, sikeres lefutáskor egy commit történik.
+    with get_connection(db_name) as conn:
+        for attempt in range(BUSY_RETRIES):
+            try:
+                conn.execute("BEGIN IMMEDIATE")
+                break
+            except sqlite3.OperationalError as e:
+                if not _is_busy(e) or attempt == BUSY_RETRIES - 1:
+                    raise
+                sleep(BUSY_BACKOFF * 2 ** attempt)
+        try:
+            yield conn
+        except BaseException:
+            conn.rollback()
+            raise
+        conn.commit()
+
+def close_all_connections(db_name=None):
+    # db_name megadásakor csak annak az adatbázisnak a tétlen kapcsolatait zárja le
+    with _pool_lock:
+        if db_name is None:
+            pools = list(_pools.values())
+            _pools.clear()
+        else:
+            pools = [_pools.pop(db_name, [])]
+    for pool in pools:
+        for conn in pool:
+            conn.close()
+
+# ---------- SNAPSHOTS ----------
+
+# Pillanatkép a kötegelt olvasóknak (reminder job, statisztikák): a sqlite3 backup API
+# egyetlen lépésben (pages=-1) másolja az adatbázist egy külön fájlba. WAL módban ez egy
+# olvasó tranzakció, ami az írókat nem akasztja meg, és a másolat egy időpontnak felel meg.
+# Utána a hosszú olvasások a másolaton futnak, így nem tartanak nyitva olvasó tranzakciót
+# az élő fájlon (ami a WAL checkpointot is visszatartaná), és több folyamat is ugyanazt
+# az állapotot látja.
+
+def snapshot_database(target, db_name=DB_NAME):
+    with get_connection(db_name) as source:
+        dest = sqlite3.connect(target)
+        try:
+            source.backup(dest)
+        finally:
+            dest.close()
+    return target
+
+@contextmanager
+def open_snapshot(db_name=DB_NAME, directory=None):
+    # Ideiglenes pillanatkép; a blokk végén a kapcsolatai lezárulnak és a fájl törlődik.
+    # A visszaadott útvonal bárhol használható db_name-ként (get_connection, open_repository).
+    # A tempfile-t csak itt töltjük be, az alkalmazás importja nem fizeti meg.
+    import tempfile
+
+    fd, path = tempfile.mkstemp(prefix="plants-snapshot-", suffix=".db", dir=directory)
+    os.close(fd)
+    try:
+        yield snapshot_database(path, db_name)
+    finally:
+        close_all_connections(path)
+        for suffix in ("", "-wal", "-shm"):
+            if os.path.exists(path + suffix):
+                os.remove(path + suffix)
+
+# ---------- READ CACHE ----------
+
+# A Streamlit minden kattintásnál újrafuttatja a scriptet, ezért az olvasó függvények
+# eredményét memóriában tartjuk. A kulcs része a függvény argumentumai (pl. username),
+# az érintett táblák verziószáma és a mai nap; az író függvények az invalidate() hívással
+# csak a módosított táblák verzióját léptetik. A TTL a más folyamatokból érkező
+# módosítások miatti elavulást korlátozza.
+CACHE_TTL = 300
+CACHE_SIZE = 512
+
+_cache = OrderedDict()
+_cache_lock = threading.Lock()
+_table_versions = {"plants": 0, "watering_logs": 0, "users": 0}
+
+def invalidate(*tables):
+    with _cache_lock:
+        for table in tables:
+            _table_versions[table] += 1
+
+def clear_cache():
+    with _cache_lock:
+        _cache.clear()
+
+def cached(*tables):
+    # A visszaadott értéket több hívó is megkaphatja, ezért azt módosítani tilos
+    def decorator(func):
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            with _cache_lock:
+                versions = tuple(_table_versions[table] for table in tables)
+            key = (func.__name__, args, tuple(sorted(kwargs.items())), versions, date.today())
+            now = monotonic()
+            with _cache_lock:
+                hit = _cache.get(key)
+                if hit is not None and hit[0] > now:
+                    _cache.move_to_end(key)
+                    return hit[1]
+            # a lekérdezés a zár nélkül fut; ha közben írás történt, a régi verziójú kulcs már nem talál
+            value = func(*args, **kwargs)
+            with _cache_lock:
+                _cache[key] = (now + CACHE_TTL, value)
+                _cache.move_to_end(key)
+                while len(_cache) > CACHE_SIZE:
+                    _cache.popitem(last=False)
+            return value
+        wrapper.uncached = func
+        return wrapper
+    return decorator
+
+# ---------- CHANGE LISTENERS ----------
+
+# Növény változások (hozzáadás, öntözés, törlés) értesítése, pl. a due_scheduler kupacának
+# frissítéséhez. A hívás a commit után történik, a visszahívás már a friss adatot olvassa.
+_plant_listeners = []
+
+def add_plant_listener(callback):
+    # callback(plant_ids): a megváltozott vagy törölt növények id-i
+    _plant_listeners.append(callback)
+
+def _plants_changed(plant_ids):
+    for callback in list(_plant_listeners):
+        callback(plant_ids)
+
+# ---------- TIMEZONES ----------
+
+# A felhasználó napja a saját időzónája szerint telik: az öntözés napja, a next_due és a
+# "ma esedékes" is helyi dátum, a szerver (vagy a UTC-ben futó cron) órájától függetlenül.
+# Időzóna nélküli felhasználóknál ez az alapértelmezés (IANA név, pl. "Europe/Budapest").
+DEFAULT_TIMEZONE = os.environ.get("DEFAULT_TIMEZONE", "Europe/Budapest")
+
+@lru_cache(maxsize=None)
+def get_zone(timezone_name):
+    # Hiányzó vagy ismeretlen név esetén az alapértelmezett időzóna
+    try:
+        return ZoneInfo(timezone_name or DEFAULT_TIMEZONE)
+    except (ZoneInfoNotFoundError, ValueError):
+        return ZoneInfo(DEFAULT_TIMEZONE)
+
+def local_now(timezone_name=None, now=None):
+    return (now or datetime.now(timezone.utc)).astimezone(get_zone(timezone_name))
+
+def local_today(timezone_name=None, now=None):
+    return local_now(timezone_name, now).date()
+
+@cached("users")
+def get_user_timezone(username, db_name=DB_NAME):
+    with get_connection(db_name) as conn:
+        row = conn.execute("SELECT timezone FROM users WHERE username = ?", (username,)).fetchone()
+    return (row and row[0]) or DEFAULT_TIMEZONE
+
+def user_today(username, db_name=DB_NAME):
+    return local_today(get_user_timezone(username, db_name))
+
+def set_user_timezone(username, timezone_name):
+    # Ismeretlen időzóna névnél ZoneInfoNotFoundError (KeyError) vagy ValueError
+    ZoneInfo(timezone_name)
+    with write_transaction() as conn:
+        conn.execute("UPDATE users SET timezone = ? WHERE username = ?", (timezone_name, username))
+        plant_ids = [row[0] for row in conn.execute("SELECT id FROM plants WHERE username = ?", (username,))]
+    # a növények esedékességi időpontja (helyi éjfél) is eltolódik
+    invalidate("users", "plants")
+    _plants_changed(plant_ids)
+
+def _chunks(ids, size=500):
+    # Hosszú IN (...) listák darabolása: a régebbi SQLite egy lekérdezésben legfeljebb 999
+    # paramétert enged
+    ids = list(ids)
+    for i in range(0, len(ids), size):
+        yield ids[i:i + size]
+
+def _owner_timezones(conn, plant_ids):
+    # plant_id -> a tulajdonos időzónájának neve (None: alapértelmezett)
+    zones = {}
+    for chunk in _chunks(plant_ids):
+        zones.update(conn.execute(f"""
+            SELECT p.id, u.timezone FROM plants p
+            LEFT JOIN users u ON u.username = p.username
+            WHERE p.id IN ({', '.join('?' * len(chunk))})
+        """, chunk))
+    return zones
+
+def _owner_now(conn, plant_ids):
+    # plant_id -> a tulajdonos helyi ideje most
+    now = datetime.now(timezone.utc)
+    zones = _owner_timezones(conn, plant_ids)
+    by_zone = {name: local_now(name, now) for name in set(zones.values())}
+    default = local_now(None, now)
+    return {plant_id: by_zone[zones[plant_id]] if plant_id in zones else default for plant_id in plant_ids}
 
 # ---------- DB SETUP ----------
 
-def create_plant_table():
-    conn = sqlite3.connect(DB_NAME)
-    cur = conn.cursor()
-    cur.execute("""
+# A models.Plant mezői sorrendben; a dátumok nap sorszámként érkeznek (lásd _convert_day)
+PLANT_COLUMNS = 'id, username, name, frequency_days, last_watered AS "last_watered [day]", next_due AS "next_due [day]"'
+
+# A következő öntözés napja az utolsó öntözésből és a gyakoriságból, SQL oldalon számolva
+NEXT_DUE_EXPR = "date(last_watered, '+' || frequency_days || ' days')"
+
+def _create_plant_table(conn):
+    conn.execute("""
         CREATE TABLE IF NOT EXISTS plants (
             id INTEGER PRIMARY KEY,
             username TEXT,
@@ -17,13 +303,9 @@ def create_plant_table():
             last_watered TEXT
         )
     """)
-    conn.commit()
-    conn.close()
 
-def create_watering_logs_table():
-    conn = sqlite3.connect(DB_NAME)
-    cur = conn.cursor()
-    cur.execute("""
+def _create_watering_logs_table(conn):
+    conn.execute("""
         CREATE TABLE IF NOT EXISTS watering_logs (
             id INTEGER PRIMARY KEY,
             plant_id INTEGER,
@@ -32,126 +314,691 @@ def create_watering_logs_table():
             FOREIGN KEY (plant_id) REFERENCES plants(id)
         )
     """)
-    conn.commit()
-    conn.close()
+
+def _add_next_due_column(conn):
+    # Régi adatbázisok migrálása: next_due oszlop felvétele és feltöltése
+    columns = [row[1] for row in conn.execute("PRAGMA table_info(plants)")]
+    if "next_due" not in columns:
+        conn.execute("ALTER TABLE plants ADD COLUMN next_due TEXT")
+        # öntözési dátum nélküli növény azonnal esedékes
+        conn.execute(f"UPDATE plants SET next_due = COALESCE({NEXT_DUE_EXPR}, ?)",
+                     (datetime.now().strftime("%Y-%m-%d"),))
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_plants_next_due ON plants (next_due)")
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_plants_username_next_due ON plants (username, next_due)")
+
+def _add_watering_logs_index(conn):
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_watering_logs_plant_watered ON watering_logs (plant_id, watered_at)")
+
+def _create_outbox_table(conn):
+    # Kimenő levelek sora; a dedup_key miatt ugyanaz az értesítő csak egyszer kerül be
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS outbox (
+            id INTEGER PRIMARY KEY,
+            dedup_key TEXT UNIQUE,
+            recipient TEXT,
+            subject TEXT,
+            body TEXT,
+            status TEXT DEFAULT 'pending',
+            attempts INTEGER DEFAULT 0,
+            last_error TEXT,
+            created_at TEXT,
+            sent_at TEXT
+        )
+    """)
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_outbox_status ON outbox (status, id)")
+
+# Öntözési statisztikák előre összesítve: minden új napló bejegyzés növényenként
+# egy-egy UPSERT-tel frissíti őket, így a statisztikák nem olvassák végig a teljes naplót.
+# A két öntözés közötti napok száma (gap) és a növény tervezett gyakorisága (freq):
+_GAP = "(julianday(date(:watered_at)) - julianday(date(last_watered_at)))"
+_FREQ = "(SELECT frequency_days FROM plants WHERE id = :plant_id)"
+# Egymást követő, határidőn belüli öntözések száma; az azonos napi ismétlés nem számít
+_STREAK = f"CASE WHEN {_GAP} <= 0 THEN streak WHEN {_GAP} <= {_FREQ} THEN streak + 1 ELSE 1 END"
+
+ROLLUP_STATS_SQL = f"""
+    INSERT INTO watering_stats (plant_id, waterings, first_watered_at, last_watered_at,
+                                interval_days, interval_count, overdue_days, streak, best_streak)
+    VALUES (:plant_id, 1, :watered_at, :watered_at, 0, 0, 0, 1, 1)
+    ON CONFLICT (plant_id) DO UPDATE SET
+        waterings = waterings + 1,
+        last_watered_at = max(last_watered_at, :watered_at),
+        interval_days = interval_days + max({_GAP}, 0),
+        interval_count = interval_count + ({_GAP} > 0),
+        overdue_days = overdue_days + max({_GAP} - {_FREQ}, 0),
+        streak = {_STREAK},
+        best_streak = max(best_streak, {_STREAK})
+"""
+
+ROLLUP_WEEKLY_SQL = """
+    INSERT INTO watering_weekly (plant_id, week_start, waterings)
+    VALUES (:plant_id, date(:watered_at, 'weekday 0', '-6 days'), 1)
+    ON CONFLICT (plant_id, week_start) DO UPDATE SET waterings = waterings + 1
+"""
+
+def _update_rollups(conn, logs):
+    # logs: (plant_id, watered_at) párok időrendben
+    params = [{"plant_id": plant_id, "watered_at": watered_at} for plant_id, watered_at in logs]
+    conn.executemany(ROLLUP_STATS_SQL, params)
+    conn.executemany(ROLLUP_WEEKLY_SQL, params)
+
+def _create_rollup_tables(conn):
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS watering_stats (
+            plant_id INTEGER PRIMARY KEY,
+            waterings INTEGER,
+            first_watered_at TEXT,
+            last_watered_at TEXT,
+            interval_days INTEGER,
+            interval_count INTEGER,
+            overdue_days INTEGER,
+            streak INTEGER,
+            best_streak INTEGER
+        )
+    """)
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS watering_weekly (
+            plant_id INTEGER,
+            week_start TEXT,
+            waterings INTEGER,
+            PRIMARY KEY (plant_id, week_start)
+        )
+    """)
+    # A meglévő napló feldolgozása: a heti összesítő egy GROUP BY, a növényenkénti statisztikát
+    # ugyanazzal az UPSERT-tel játsszuk vissza, amit az új bejegyzések is kapnak (kurzorról, memóriában tartás nélkül)
+    conn.execute("DELETE FROM watering_stats")
+    conn.execute("DELETE FROM watering_weekly")
+    conn.execute("""
+        INSERT INTO watering_weekly (plant_id, week_start, waterings)
+        SELECT plant_id, date(watered_at, 'weekday 0', '-6 days'), COUNT(*)
+        FROM watering_logs
+        GROUP BY 1, 2
+    """)
+    logs = conn.execute("SELECT plant_id, watered_at FROM watering_logs ORDER BY plant_id, watered_at")
+    conn.executemany(ROLLUP_STATS_SQL, ({"plant_id": plant_id, "watered_at": watered_at}
+                                        for plant_id, watered_at in logs))
+
+def _create_retention_tables(conn):
+    # Az archivált (watering_logs-ból törölt) bejegyzések havi összesítője és a karbantartás naplója
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS watering_monthly (
+            plant_id INTEGER,
+            month TEXT,
+            waterings INTEGER,
+            first_watered_at TEXT,
+            last_watered_at TEXT,
+            PRIMARY KEY (plant_id, month)
+        )
+    """)
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS maintenance_runs (
+            task TEXT PRIMARY KEY,
+            last_run TEXT
+        )
+    """)
+
+def _create_users_table(conn):
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS users (
+            id INTEGER PRIMARY KEY,
+            username TEXT UNIQUE,
+            password TEXT,
+            email TEXT
+        )
+    """)
+
+def _merge_users_db(conn):
+    # A users tábla a növényekkel egy adatbázisba kerül, így JOIN-olhatók; a régi
+    # users.db tartalmát (ha van a fő adatbázis mellett) átmásoljuk. ATTACH tranzakción
+    # belül nem megy, ezért a régi fájlt külön, csak olvasható kapcsolattal olvassuk.
+    _create_users_table(conn)
+    main_path = conn.execute("PRAGMA database_list").fetchone()[2]
+    if not main_path:
+        return
+    legacy_path = os.path.join(os.path.dirname(main_path), LEGACY_USERS_DB_NAME)
+    if not os.path.exists(legacy_path):
+        return
+    legacy = sqlite3.connect(f"file:{legacy_path}?mode=ro", uri=True)
+    try:
+        if legacy.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'users'").fetchone():
+            conn.executemany(
+                "INSERT OR IGNORE INTO users (username, password, email) VALUES (?, ?, ?)",
+                legacy.execute("SELECT username, password, email FROM users ORDER BY id"),
+            )
+    finally:
+        legacy.close()
+
+def _add_user_timezone_column(conn):
+    # IANA időzóna név; NULL esetén DEFAULT_TIMEZONE
+    columns = [row[1] for row in conn.execute("PRAGMA table_info(users)")]
+    if "timezone" not in columns:
+        conn.execute("ALTER TABLE users ADD COLUMN timezone TEXT")
+
+# ---------- WATERING CALENDAR ----------
+
+# Előre kiszámolt öntözési naptár: növényenként a next_due és az utána gyakoriságonként
+# következő napok (ha időben öntözik) a calendar_state.until napig. Az írási függvények
+# ugyanabban a tranzakcióban számolják újra az érintett növények sorait, a horizontot pedig
+# a get_upcoming_waterings tolja ki, amikor már nem elég (kb. CALENDAR_DAYS naponta).
+# A dátumok a tulajdonos helyi napjai, mint a next_due.
+CALENDAR_DAYS = 30
+
+_STEP = "max(frequency_days, 1)"
+# A :since napon vagy utána lévő első esedékesség, majd gyakoriságonként a következők :until-ig
+CALENDAR_FILL_SQL = f"""
+    WITH RECURSIVE occurrences (plant_id, due_date, step) AS (
+        SELECT id,
+               CASE WHEN next_due >= :since THEN next_due
+                    ELSE date(next_due, '+' || ((CAST(julianday(:since) - julianday(next_due) AS INTEGER)
+                                                 + {_STEP} - 1) / {_STEP} * {_STEP}) || ' days')
+               END,
+               {_STEP}
+        FROM plants
+        WHERE next_due IS NOT NULL {{condition}}
+        UNION ALL
+        SELECT plant_id, date(due_date, '+' || step || ' days'), step
+        FROM occurrences
+        WHERE date(due_date, '+' || step || ' days') <= :until
+    )
+    INSERT OR IGNORE INTO plant_calendar (plant_id, due_date)
+    SELECT plant_id, due_date FROM occurrences WHERE due_date <= :until
+"""
+
+def _calendar_until(conn):
+    return conn.execute("SELECT until FROM calendar_state").fetchone()[0]
+
+def _fill_calendar(conn, plant_ids=None, since=None, until=None):
+    # A múltbeli napok nem kellenek (a késésben lévő növényeknek csak a vetített napjai),
+    # az időzónák miatt egy nap ráhagyással
+    since = since or (datetime.now(timezone.utc).date() - timedelta(days=1)).isoformat()
+    until = until or _calendar_until(conn)
+    if plant_ids is None:
+        conn.execute(CALENDAR_FILL_SQL.format(condition=""), {"since": since, "until": until})
+        return
+    for chunk in _chunks(plant_ids):
+        params = {"since": since, "until": until}
+        params.update((f"id{j}", plant_id) for j, plant_id in enumerate(chunk))
+        condition = f"AND id IN ({', '.join(f':id{j}' for j in range(len(chunk)))})"
+        conn.execute(CALENDAR_FILL_SQL.format(condition=condition), params)
+
+def _refresh_calendar(conn, plant_ids):
+    # A megadott (módosított, új vagy törölt) növények sorainak újraszámolása
+    for chunk in _chunks(plant_ids):
+        conn.execute(f"DELETE FROM plant_calendar WHERE plant_id IN ({', '.join('?' * len(chunk))})", chunk)
+    _fill_calendar(conn, list(plant_ids))
+
+def _rebuild_calendar(conn):
+    conn.execute("DELETE FROM plant_calendar")
+    _fill_calendar(conn)
+
+def _create_plant_calendar(conn):
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS plant_calendar (
+            plant_id INTEGER,
+            due_date TEXT,
+            PRIMARY KEY (plant_id, due_date)
+        ) WITHOUT ROWID
+    """)
+    conn.execute("CREATE TABLE IF NOT EXISTS calendar_state (until TEXT)")
+    conn.execute("DELETE FROM calendar_state")
+    until = datetime.now(timezone.utc).date() + timedelta(days=CALENDAR_DAYS)
+    conn.execute("INSERT INTO calendar_state (until) VALUES (?)", (until.isoformat(),))
+    _rebuild_calendar(conn)
+
+# db_name -> a naptár ennyi napig biztosan ki van töltve (ne kelljen minden olvasáskor megnézni)
+_calendar_ready = {}
+
+def extend_calendar(until=None, db_name=DB_NAME):
+    # A horizont kitolása until-ig (alapból ma + CALENDAR_DAYS): csak az új napok sorai
+    # készülnek el. A tegnapelőttnél régebbi sorok törlődnek (időzónák miatt egy nap ráhagyás).
+    today = datetime.now(timezone.utc).date()
+    until = (until or today + timedelta(days=CALENDAR_DAYS)).isoformat()
+    with write_transaction(db_name) as conn:
+        current = _calendar_until(conn)
+        if current >= until:
+            _calendar_ready[db_name] = current
+            return
+        since = date.fromisoformat(current) + timedelta(days=1)
+        _fill_calendar(conn, since=since.isoformat(), until=until)
+        conn.execute("DELETE FROM plant_calendar WHERE due_date < ?",
+                     ((today - timedelta(days=1)).isoformat(),))
+        conn.execute("UPDATE calendar_state SET until = ?", (until,))
+    _calendar_ready[db_name] = until
+    invalidate("plants")
+
+def _ensure_calendar(day, db_name=DB_NAME):
+    if _calendar_ready.get(db_name, "") >= day.isoformat():
+        return
+    with get_connection(db_name) as conn:
+        current = _calendar_until(conn)
+    if current >= day.isoformat():
+        _calendar_ready[db_name] = current
+    else:
+        extend_calendar(day + timedelta(days=CALENDAR_DAYS), db_name)
+
+_DAY_GLOB = "[0-9][0-9][0-9][0-9]-[0-9][0-9]-[0-9][0-9]"
+
+def _normalize_plant_dates(conn):
+    # A régi import nullák nélküli dátumokat (pl. "2026-1-5") is eltárolt, ezekre a SQLite
+    # date() NULL-t ad, így a next_due is NULL lett. Kanonikus alakra hozzuk őket; ami nem
+    # értelmezhető, az öntözési dátum nélküli növényként azonnal esedékes.
+    rows = conn.execute(f"""
+        SELECT id, last_watered FROM plants
+        WHERE last_watered NOT GLOB '{_DAY_GLOB}'
+           OR next_due NOT GLOB '{_DAY_GLOB}'
+           OR next_due IS NULL
+    """).fetchall()
+    today = datetime.now(timezone.utc).date().isoformat()
+    for plant_id, last_watered in rows:
+        try:
+            last_watered = datetime.strptime(last_watered, "%Y-%m-%d").date().isoformat()
+        except (TypeError, ValueError):
+            last_watered = None
+        conn.execute(f"""
+            UPDATE plants SET last_watered = :last_watered,
+                              next_due = COALESCE(date(:last_watered, '+' || frequency_days || ' days'), :today)
+            WHERE id = :plant_id
+        """, {"last_watered": last_watered, "today": today, "plant_id": plant_id})
+    _refresh_calendar(conn, [row[0] for row in rows])
+
+# ---------- MIGRATIONS ----------
+
+# A séma verzióját a PRAGMA user_version tárolja: az i. lépés után az értéke i.
+# Meglévő lépést módosítani tilos, új lépést mindig a lista végére kell felvenni.
+PLANTS_MIGRATIONS = [
+    _create_plant_table,
+    _create_watering_logs_table,
+    _add_next_due_column,
+    _add_watering_logs_index,
+    _create_outbox_table,
+    _create_rollup_tables,
+    _create_retention_tables,
+    _merge_users_db,
+    _add_user_timezone_column,
+    _create_plant_calendar,
+    _normalize_plant_dates,
+]
+
+_migrated = set()
+_migrate_lock = threading.Lock()
+
+def migrate(db_name, migrations=PLANTS_MIGRATIONS):
+    with get_connection(db_name) as conn:
+        while True:
+            # BEGIN IMMEDIATE: párhuzamosan induló folyamatok ne futtassák kétszer ugyanazt a lépést
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                version = conn.execute("PRAGMA user_version").fetchone()[0]
+                if version >= len(migrations):
+                    conn.rollback()
+                    return version
+                migrations[version](conn)
+                conn.execute(f"PRAGMA user_version = {version + 1}")
+                conn.commit()
+            except BaseException:
+                conn.rollback()
+                raise
+
+def init_db(db_name=DB_NAME):
+    # Folyamatonként egyszer fut le, a Streamlit újrafuttatásai már csak a halmazt nézik meg
+    with _migrate_lock:
+        if db_name not in _migrated:
+            migrate(db_name)
+            _migrated.add(db_name)
 
 # ---------- CRUD FUNCTIONS ----------
 
 def add_plant(username, name, frequency_days):
-    conn = sqlite3.connect(DB_NAME)
-    cur = conn.cursor()
-    cur.execute("""
-        INSERT INTO plants (username, name, frequency_days, last_watered)
-        VALUES (?, ?, ?, ?)
-    """, (username, name, frequency_days, datetime.now().strftime("%Y-%m-%d")))
-    conn.commit()
-    conn.close()
+    today = user_today(username)
+    next_due = today + timedelta(days=frequency_days)
+    with write_transaction() as conn:
+        cur = conn.execute("""
+            INSERT INTO plants (username, name, frequency_days, last_watered, next_due)
+            VALUES (?, ?, ?, ?, ?)
+        """, (username, name, frequency_days, today.strftime("%Y-%m-%d"), next_due.strftime("%Y-%m-%d")))
+        _refresh_calendar(conn, [cur.lastrowid])
+    invalidate("plants")
+    _plants_changed([cur.lastrowid])
 
+@cached("plants")
 def get_user_plants(username):
-    conn = sqlite3.connect(DB_NAME)
-    cur = conn.cursor()
-    cur.execute("SELECT * FROM plants WHERE username = ?", (username,))
-    rows = cur.fetchall()
-    conn.close()
-    return rows
+    with get_connection() as conn:
+        rows = conn.execute(f"SELECT {PLANT_COLUMNS} FROM plants WHERE username = ?", (username,)).fetchall()
+    return [Plant(*row) for row in rows]
 
+@cached("plants")
 def get_all_plants():
-    conn = sqlite3.connect(DB_NAME)
-    cur = conn.cursor()
-    cur.execute("SELECT * FROM plants")
-    rows = cur.fetchall()
-    conn.close()
-    return rows
+    with get_connection() as conn:
+        rows = conn.execute(f"SELECT {PLANT_COLUMNS} FROM plants").fetchall()
+    return [Plant(*row) for row in rows]
 
 def delete_plant(plant_id, username=None):
-    conn = sqlite3.connect(DB_NAME)
-    cur = conn.cursor()
-    if username is None:
-        cur.execute("DELETE FROM plants WHERE id = ?", (plant_id,))
-    else:
-        cur.execute("DELETE FROM plants WHERE id = ? AND username = ?", (plant_id, username))
-    conn.commit()
-    conn.close()
+    with write_transaction() as conn:
+        if username is None:
+            conn.execute("DELETE FROM plants WHERE id = ?", (plant_id,))
+        else:
+            conn.execute("DELETE FROM plants WHERE id = ? AND username = ?", (plant_id, username))
+        _refresh_calendar(conn, [plant_id])
+    invalidate("plants")
+    _plants_changed([plant_id])
 
 def update_last_watered(plant_id, username=None):
-    conn = sqlite3.connect(DB_NAME)
-    cur = conn.cursor()
-    cur.execute("""
-        UPDATE plants SET last_watered = ?
-        WHERE id = ?
-    """, (datetime.now().strftime("%Y-%m-%d"), plant_id))
-    conn.commit()
-    conn.close()
+    with write_transaction() as conn:
+        today = _owner_now(conn, [plant_id])[plant_id].strftime("%Y-%m-%d")
+        conn.execute("""
+            UPDATE plants SET last_watered = :today,
+                              next_due = date(:today, '+' || frequency_days || ' days')
+            WHERE id = :plant_id
+        """, {"today": today, "plant_id": plant_id})
+        _refresh_calendar(conn, [plant_id])
+    invalidate("plants")
+    _plants_changed([plant_id])
 
 def add_watering_log(plant_id, watered_by):
-    conn = sqlite3.connect(DB_NAME)
-    cur = conn.cursor()
-    watered_at = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-    cur.execute("""
+    with write_transaction() as conn:
+        watered_at = _owner_now(conn, [plant_id])[plant_id].strftime("%Y-%m-%d %H:%M:%S")
+        conn.execute("""
+            INSERT INTO watering_logs (plant_id, watered_by, watered_at)
+            VALUES (?, ?, ?)
+        """, (plant_id, watered_by, watered_at))
+        _update_rollups(conn, [(plant_id, watered_at)])
+    invalidate("watering_logs")
+
+def update_last_watered_and_log(plant_id, watered_by):
+    # A last_watered frissítése és a napló bejegyzés egy tranzakcióban: vagy mindkettő megtörténik, vagy egyik sem
+    water_plants([plant_id], watered_by)
+
+# ---------- BULK OPERATIONS ----------
+
+def _water(conn, plant_ids, watered_by):
+    # A nap és az időpont a növény tulajdonosának időzónája szerinti
+    now = _owner_now(conn, plant_ids)
+    today = {plant_id: now[plant_id].strftime("%Y-%m-%d") for plant_id in plant_ids}
+    watered_at = {plant_id: now[plant_id].strftime("%Y-%m-%d %H:%M:%S") for plant_id in plant_ids}
+    conn.executemany("""
+        UPDATE plants SET last_watered = ?,
+                          next_due = date(?, '+' || frequency_days || ' days')
+        WHERE id = ?
+    """, [(today[plant_id], today[plant_id], plant_id) for plant_id in plant_ids])
+    conn.executemany("""
         INSERT INTO watering_logs (plant_id, watered_by, watered_at)
         VALUES (?, ?, ?)
-    """, (plant_id, watered_by, watered_at))
-    conn.commit()
-    conn.close()
+    """, [(plant_id, watered_by, watered_at[plant_id]) for plant_id in plant_ids])
+    _update_rollups(conn, [(plant_id, watered_at[plant_id]) for plant_id in plant_ids])
+    _refresh_calendar(conn, plant_ids)
 
-def update_last_watered_and_log(plant_id, watered_by):
-    update_last_watered(plant_id)
-    add_watering_log(plant_id, watered_by)
+def water_plants(plant_ids, watered_by):
+    # Több növény öntözése egyetlen tranzakcióban (egy commit, egy fsync), executemany-vel
+    plant_ids = list(plant_ids)
+    if not plant_ids:
+        return 0
+    with write_transaction() as conn:
+        _water(conn, plant_ids, watered_by)
+    invalidate("plants", "watering_logs")
+    _plants_changed(plant_ids)
+    return len(plant_ids)
+
+def water_all_due(username, watered_by=None):
+    # A felhasználó összes ma (helyi idő szerint) esedékes növényének öntözése; visszaadja az
+    # öntözött növények számát
+    today = user_today(username).strftime("%Y-%m-%d")
+    with write_transaction() as conn:
+        plant_ids = [row[0] for row in conn.execute(
+            "SELECT id FROM plants WHERE username = ? AND next_due <= ?", (username, today))]
+        _water(conn, plant_ids, watered_by or username)
+    invalidate("plants", "watering_logs")
+    _plants_changed(plant_ids)
+    return len(plant_ids)
+
+def import_plants(username, plants):
+    # plants: (name, frequency_days, last_watered vagy None) elemek; egy tranzakcióban kerülnek be
+    today = user_today(username).strftime("%Y-%m-%d")
+    rows = [
+        (username, name, frequency_days, last_watered or today, last_watered or today, frequency_days)
+        for name, frequency_days, last_watered in plants
+    ]
+    if not rows:
+        return 0
+    with write_transaction() as conn:
+        # az új sorok id-je a korábbi legnagyobb fölé kerül (INTEGER PRIMARY KEY, írási zár alatt)
+        last_id = conn.execute("SELECT COALESCE(MAX(id), 0) FROM plants").fetchone()[0]
+        conn.executemany("""
+            INSERT INTO plants (username, name, frequency_days, last_watered, next_due)
+            VALUES (?, ?, ?, ?, date(?, '+' || ? || ' days'))
+        """, rows)
+        plant_ids = [row[0] for row in conn.execute("SELECT id FROM plants WHERE id > ?", (last_id,))]
+        _refresh_calendar(conn, plant_ids)
+    invalidate("plants")
+    _plants_changed(plant_ids)
+    return len(rows)
 
 # ---------- DUE TODAY ----------
 
-def get_plants_due_today(username):
-    plants = get_user_plants(username)
-    due_today = []
+@cached("plants")
+def get_plants_due_today(username, day=None):
+    # idx_plants_username_next_due index tartomány-kereséssel. A day (date) a felhasználó helyi
+    # napja; a hívó adja meg, hogy a cache kulcs is a helyi nap szerint váltson
+    today = (day or user_today(username)).strftime("%Y-%m-%d")
+    with get_connection() as conn:
+        rows = conn.execute(f"""
+            SELECT {PLANT_COLUMNS} FROM plants
+            WHERE username = ? AND next_due <= ?
+        """, (username, today)).fetchall()
+    return [Plant(*row, due=True) for row in rows]
+
+def shard_of(username, shard_count):
+    # Stabil (folyamatok között is azonos) felosztás a felhasználónév crc32 hash-e alapján
+    return zlib.crc32(username.encode()) % shard_count
+
+def past_reminder_time(local, not_before=None):
+    # A helyi időpont (naptól függetlenül) elérte-e a not_before időt; not_before nélkül mindig
+    return not_before is None or local.time() >= not_before
+
+def iter_due_reminders(now=None, db_name=DB_NAME, shard_count=1, shard_index=0, not_before=None):
+    # Felhasználónként egy (username, email, [növénynevek], helyi nap) elemet ad vissza a kurzorról
+    # olvasva, így a memóriában egyszerre csak egy felhasználó esedékes növényei vannak.
+    # A plants (username, next_due) indexét username szerint rendezve járjuk be, nincs külön rendezés.
+    # shard_count > 1 esetén csak a shard_index-edik szeletbe eső felhasználókat adja vissza.
+    # Az esedékesség a felhasználó helyi napja szerint számít (now: időzónás időpont, alapból
+    # most); not_before megadásakor csak azok kerülnek sorra, akiknél a helyi idő már elérte
+    # (lásd past_reminder_time), így egy óránként futó job mindenkinek a saját idejében küld.
+    now = now or datetime.now(timezone.utc)
+    days = {}
 
-    for plant in plants:
-        _, _, name, freq, last_watered = plant
-        last_date = datetime.strptime(last_watered, "%Y-%m-%d")
-        next_due = last_date + timedelta(days=freq)
-        if datetime.now().date() >= next_due.date():
-            due_today.append(plant)
+    def reminder_day(timezone_name):
+        # A felhasználó helyi napja, vagy NULL, ha nála most nincs értesítési idő
+        if timezone_name not in days:
+            local = local_now(timezone_name, now)
+            days[timezone_name] = local.date().isoformat() if past_reminder_time(local, not_before) else None
+        return days[timezone_name]
 
-    return due_today
+    # a legkésőbbi helyi nap bármely időzónában (UTC+14); az index tartományt ez szűkíti
+    latest = (now.astimezone(timezone.utc) + timedelta(hours=14)).date().isoformat()
+    with get_connection(db_name) as conn:
+        conn.create_function("shard_of", 2, shard_of, deterministic=True)
+        conn.create_function("reminder_day", 1, reminder_day)
+        cur = conn.execute("""
+            SELECT p.username, u.email, p.name, reminder_day(u.timezone)
+            FROM plants p INDEXED BY idx_plants_username_next_due
+            JOIN users u ON u.username = p.username
+            WHERE p.next_due <= ? AND p.next_due <= reminder_day(u.timezone)
+              AND u.email IS NOT NULL AND u.email != ''
+              AND (? = 1 OR shard_of(p.username, ?) = ?)
+            ORDER BY p.username
+        """, (latest, shard_count, shard_count, shard_index))
+        for (username, email, day), rows in groupby(cur, key=lambda row: (row[0], row[1], row[3])):
+            yield username, email, [row[2] for row in rows], date.fromisoformat(day)
 
+@cached("watering_logs")
 def get_last_watering_info(plant_id):
-    conn = sqlite3.connect(DB_NAME)
-    cur = conn.cursor()
-    cur.execute("""
-        SELECT watered_by, watered_at FROM watering_logs
-        WHERE plant_id = ?
-        ORDER BY watered_at DESC
-        LIMIT 1
-    """, (plant_id,))
-    row = cur.fetchone()
-    conn.close()
-    return row  # (watered_by, watered_at) vagy None
-
-def create_users_table():
-    conn = sqlite3.connect("users.db")
-    cur = conn.cursor()
-    cur.execute("""
-        CREATE TABLE IF NOT EXISTS users (
-            id INTEGER PRIMARY KEY,
-            username TEXT UNIQUE,
-            password TEXT,
-            email TEXT
-        )
-    """)
-    conn.commit()
-    conn.close()
+    with get_connection() as conn:
+        row = conn.execute("""
+            SELECT watered_by, watered_at FROM watering_logs
+            WHERE plant_id = ?
+            ORDER BY watered_at DESC
+            LIMIT 1
+        """, (plant_id,)).fetchone()
+    return WateringLog(plant_id, *row) if row else None
+
+# A dashboard listák oszlopai: a Plant mezői, az esedékesség és a legutolsó napló bejegyzés
+LISTING_COLUMNS = """
+    p.id, p.username, p.name, p.frequency_days,
+    p.last_watered AS "last_watered [day]", p.next_due AS "next_due [day]",
+    p.username = ? AND p.next_due <= ? AS due,
+    l.watered_by, l.watered_at
+"""
 
+def _listing(row):
+    plant_id, username, name, frequency_days, last_watered, next_due, due, watered_by, watered_at = row
+    last_log = WateringLog(plant_id, watered_by, watered_at) if watered_at else None
+    return Plant(plant_id, username, name, frequency_days, last_watered, next_due, bool(due), last_log)
+
+# Lapozható rendezések: a rendezési kulcs mindig egyedi (id-re végződik), így keyset lapozásra alkalmas
+PLANT_SORTS = {
+    "id": ("p.id",),
+    "next_due": ("p.next_due", "p.id"),
+}
+
+@cached("plants", "watering_logs")
+def get_plants_page(username, page_size=20, after=None, sort="id", search=None, day=None):
+    # Keyset lapozás: az after az előző oldal utolsó sorának rendezési kulcsa (None = első oldal),
+    # így minden oldal egy index-tartomány olvasása, OFFSET nélkül. Visszaad: ([Plant], következő after),
+    # a Plant-ek due és last_log mezője is ki van töltve (day: a felhasználó helyi napja)
+    today = (day or user_today(username)).strftime("%Y-%m-%d")
+    order = PLANT_SORTS[sort]
+    conditions = []
+    params = [username, today]
+    if search:
+        escaped = search.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+        conditions.append("p.name LIKE ? ESCAPE '\\'")
+        params.append(f"%{escaped}%")
+    if after is not None and after[0] is None:
+        # NULL next_due (a rendezésben elöl): a további NULL-os sorok, majd az összes többi
+        conditions.append("((p.next_due IS NULL AND p.id > ?) OR p.next_due IS NOT NULL)")
+        params.append(after[1])
+    elif after is not None:
+        conditions.append(f"({', '.join(order)}) > ({', '.join('?' * len(order))})")
+        params.extend(after)
+    where = f"WHERE {' AND '.join(conditions)}" if conditions else ""
+    params.append(page_size + 1)
+
+    with get_connection() as conn:
+        rows = conn.execute(f"""
+            SELECT {LISTING_COLUMNS}
+            FROM plants p
+            LEFT JOIN watering_logs l ON l.id = (
+                SELECT id FROM watering_logs
+                WHERE plant_id = p.id
+                ORDER BY watered_at DESC
+                LIMIT 1
+            )
+            {where}
+            ORDER BY {', '.join(order)}
+            LIMIT ?
+        """, params).fetchall()
+
+    plants = [_listing(row) for row in rows[:page_size]]
+    if len(rows) <= page_size:
+        return plants, None
+    last = plants[-1]
+    next_after = (last.id,) if sort == "id" else (day_to_text(last.next_due), last.id)
+    return plants, next_after
+
+@cached("plants")
+def get_upcoming_waterings(username, days=7, day=None):
+    # A következő `days` nap öntözései az előre kiszámolt naptárból, napok szerint rendezve:
+    # [(nap sorszám, Plant)]. A késésben lévő növények kimaradnak (azok a get_plants_due_today
+    # listájában vannak, és a következő esedékességük az öntözés napjától függ).
+    today = day or user_today(username)
+    until = today + timedelta(days=days)
+    _ensure_calendar(until)
+    with get_connection() as conn:
+        rows = conn.execute("""
+            SELECT c.due_date AS "due_date [day]",
+                   p.id, p.username, p.name, p.frequency_days,
+                   p.last_watered AS "last_watered [day]", p.next_due AS "next_due [day]"
+            FROM plants p
+            JOIN plant_calendar c ON c.plant_id = p.id
+            WHERE p.username = ? AND p.next_due >= ? AND c.due_date > ? AND c.due_date <= ?
+            ORDER BY c.due_date, p.id
+        """, (username, today.isoformat(), today.isoformat(), until.isoformat())).fetchall()
+    return [(row[0], Plant(*row[1:])) for row in rows]
+
+@cached("users")
 def get_user_email(username):
-    conn = sqlite3.connect("users.db")  # Erről plants.db-ről users.db-re cserélve
-    cur = conn.cursor()
-    cur.execute("SELECT email FROM users WHERE username = ?", (username,))
-    row = cur.fetchone()
-    conn.close()
+    with get_connection() as conn:
+        row = conn.execute("SELECT email FROM users WHERE username = ?", (username,)).fetchone()
     return row[0] if row else None
 
 def delete_user_and_plants(username):
-    conn = sqlite3.connect(DB_NAME)
-    cur = conn.cursor()
-    cur.execute("DELETE FROM plants WHERE username = ?", (username,))
-    cur.execute("DELETE FROM users WHERE username = ?", (username,))
-    conn.commit()
-    conn.close()
+    with write_transaction() as conn:
+        plant_ids = [row[0] for row in conn.execute("SELECT id FROM plants WHERE username = ?", (username,))]
+        conn.execute("DELETE FROM plants WHERE username = ?", (username,))
+        conn.execute("DELETE FROM users WHERE username = ?", (username,))
+        _refresh_calendar(conn, plant_ids)
+    invalidate("plants", "users")
+    _plants_changed(plant_ids)
+
+# ---------- OUTBOX ----------
+
+def enqueue_email(recipient, subject, body, dedup_key=None):
+    # True, ha új levél került a sorba; False, ha ezzel a kulccsal már volt
+    created_at = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+    with write_transaction() as conn:
+        cur = conn.execute("""
+            INSERT OR IGNORE INTO outbox (dedup_key, recipient, subject, body, created_at)
+            VALUES (?, ?, ?, ?, ?)
+        """, (dedup_key, recipient, subject, body, created_at))
+        return cur.rowcount == 1
+
+def record_sent_email(recipient, subject, body, dedup_key, db_name=DB_NAME):
+    # Máshol (pl. a send_reminder cron jobban) elküldött levél rögzítése 'sent' állapotban, hogy
+    # a dedup_key alapján se az alkalmazás, se a job következő futása ne küldje el újra
+    now = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+    with write_transaction(db_name) as conn:
+        conn.execute("""
+            INSERT OR IGNORE INTO outbox (dedup_key, recipient, subject, body, status, created_at, sent_at)
+            VALUES (?, ?, ?, ?, 'sent', ?, ?)
+        """, (dedup_key, recipient, subject, body, now, now))
+
+def reminder_key(day, email):
+    # Felhasználónként napi egy értesítő: az alkalmazás és a send_reminder is ezt a kulcsot nézi
+    return f"reminder:{day.isoformat()}:{email}"
+
+def is_email_queued(dedup_key):
+    with get_connection() as conn:
+        return conn.execute("SELECT 1 FROM outbox WHERE dedup_key = ?", (dedup_key,)).fetchone() is not None
+
+def get_pending_emails(limit=100):
+    with get_connection() as conn:
+        return conn.execute("""
+            SELECT id, recipient, subject, body FROM outbox
+            WHERE status = 'pending'
+            ORDER BY id
+            LIMIT ?
+        """, (limit,)).fetchall()
+
+def mark_email_sent(email_id):
+    sent_at = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+    with write_transaction() as conn:
+        conn.execute("UPDATE outbox SET status = 'sent', sent_at = ? WHERE id = ?", (sent_at, email_id))
+
+def mark_email_failed(email_id, error, max_attempts=5):
+    # max_attempts sikertelen próbálkozás után a levél 'failed' állapotba kerül és nem próbáljuk újra
+    with write_transaction() as conn:
+        conn.execute("""
+            UPDATE outbox
+            SET attempts = attempts + 1,
+                last_error = ?,
+                status = CASE WHEN attempts + 1 >= ? THEN 'failed' ELSE 'pending' END
+            WHERE id = ?
+        """, (error, max_attempts, email_id))
+
+# ---------- INSTRUMENTATION ----------
+
+# Hívásszám, késleltetés és visszaadott sorok minden publikus függvényre. A kapcsolat- és
+# cache-kezelők, az SQL-ből soronként hívott shard_of és az időzóna segédfüggvények kimaradnak.
+instrument_module(globals(), exclude={
+    "get_connection", "write_transaction", "close_all_connections", "open_snapshot",
+    "invalidate", "clear_cache", "cached", "shard_of", "add_plant_listener", "reminder_key",
+    "get_zone", "local_now", "local_today", "past_reminder_time",
+})
@@ -0,0 +1,218 @@
+import heapq
+import os
+import threading
+from datetime import datetime, time, timedelta, timezone
+from itertools import count
+from database import (
+    DB_NAME, get_connection, add_plant_listener, get_user_email, get_user_timezone,
+    get_zone, local_now, local_today,
+    enqueue_email, is_email_queued, reminder_key, _chunks,
+)
+
+# Folyamaton belüli ütemező: minden növény a következő esedékességi időpontja szerint egy
+# min-kupacban van. A database írási függvényei (hozzáadás, öntözés, törlés) után csak az
+# érintett növények frissülnek (O(k log n)), a legközelebbi esedékesség O(1)-ben látszik,
+# a "most esedékes" / "N órán belül esedékes" lekérdezés pedig csak a találatokat járja be.
+# Egy növény a next_due napján 0:00-kor válik esedékessé, a tulajdonos időzónája szerint;
+# az időpontok időzónásak, így a különböző felhasználók növényei egy kupacban rendezhetők.
+
+# Az értesítők nem mennek ki ennél korábban a címzett helyi ideje szerint (éjfélkor esedékessé váló növények miatt)
+REMINDER_NOT_BEFORE = time.fromisoformat(os.environ.get("REMINDER_NOT_BEFORE", "08:00"))
+# A háttérszál legfeljebb ennyit alszik egyhuzamban (másodperc)
+MAX_SLEEP = 300
+# Ha a kupacban ennyiszer több elem van, mint növény, újraépítjük
+COMPACT_RATIO = 2
+
+# A növény, a tulajdonosa és az időzónája; a next_due nap sorszám (lásd database._convert_day)
+PLANT_QUERY = """
+    SELECT p.id, p.username, p.name, p.next_due AS "next_due [day]", u.timezone
+    FROM plants p
+    LEFT JOIN users u ON u.username = p.username
+    WHERE p.next_due IS NOT NULL
+"""
+
+def _due_at(next_due, timezone_name):
+    # A nap kezdete a tulajdonos időzónájában
+    return datetime.combine(datetime.fromordinal(next_due), time.min, get_zone(timezone_name))
+
+def _now():
+    return datetime.now(timezone.utc)
+
+class DueScheduler:
+    def __init__(self, db_name=DB_NAME):
+        self.db_name = db_name
+        self._heap = []     # (esedékesség, sorszám, plant_id)
+        self._entries = {}  # plant_id -> (esedékesség, sorszám, username, name)
+        self._seq = count()
+        self._lock = threading.Lock()
+        self._changed = threading.Event()
+        self.reload()
+
+    def reload(self):
+        # Teljes újratöltés (induláskor és naponta, a más folyamatokból jövő módosítások miatt)
+        with get_connection(self.db_name) as conn:
+            rows = conn.execute(PLANT_QUERY).fetchall()
+        with self._lock:
+            self._entries = {}
+            for plant_id, username, name, next_due, timezone_name in rows:
+                self._entries[plant_id] = (_due_at(next_due, timezone_name), next(self._seq), username, name)
+            self._heap = [(due, seq, plant_id) for plant_id, (due, seq, _, _) in self._entries.items()]
+            heapq.heapify(self._heap)
+        self._changed.set()
+
+    def refresh(self, plant_ids):
+        # A megadott növények újraolvasása; ami már nincs meg, kikerül. A régi kupac elemek
+        # a helyükön maradnak, de a sorszámuk már nem egyezik, ezért érvénytelenek.
+        plant_ids = list(plant_ids)
+        rows = []
+        with get_connection(self.db_name) as conn:
+            for chunk in _chunks(plant_ids):
+                rows += conn.execute(
+                    f"{PLANT_QUERY} AND p.id IN ({', '.join('?' * len(chunk))})", chunk
+                ).fetchall()
+        with self._lock:
+            for plant_id in plant_ids:
+                self._entries.pop(plant_id, None)
+            for plant_id, username, name, next_due, timezone_name in rows:
+                entry = (_due_at(next_due, timezone_name), next(self._seq), username, name)
+                self._entries[plant_id] = entry
+                heapq.heappush(self._heap, (entry[0], entry[1], plant_id))
+            if len(self._heap) > COMPACT_RATIO * len(self._entries) + 64:
+                self._heap = [(due, seq, plant_id) for plant_id, (due, seq, _, _) in self._entries.items()]
+                heapq.heapify(self._heap)
+        self._changed.set()
+
+    def _valid(self, item):
+        entry = self._entries.get(item[2])
+        return entry is not None and entry[1] == item[1]
+
+    def next_due(self):
+        # A legkorábbi esedékesség (lehet a múltban is) vagy None
+        with self._lock:
+            while self._heap and not self._valid(self._heap[0]):
+                heapq.heappop(self._heap)
+            return self._heap[0][0] if self._heap else None
+
+    def due_before(self, moment, username=None):
+        # A moment előtt esedékes növények esedékesség szerint: [(esedékesség, plant_id, username, name)].
+        # A kupacot nem bontjuk le: a gyökérből indulva csak a moment előtti elemeket járjuk be.
+        result = []
+        with self._lock:
+            heap = self._heap
+            frontier = [(heap[0], 0)] if heap else []
+            while frontier:
+                item, i = heapq.heappop(frontier)
+                if item[0] > moment:
+                    continue
+                if self._valid(item):
+                    due, _, plant_id = item
+                    _, _, owner, name = self._entries[plant_id]
+                    if username is None or owner == username:
+                        result.append((due, plant_id, owner, name))
+                for child in (2 * i + 1, 2 * i + 2):
+                    if child < len(heap):
+                        heapq.heappush(frontier, (heap[child], child))
+        return result
+
+    def due_now(self, username=None):
+        return self.due_before(_now(), username)
+
+    def due_within(self, hours, username=None):
+        return self.due_before(_now() + timedelta(hours=hours), username)
+
+    def wait(self, seconds):
+        # Alvás a megadott ideig vagy a következő változásig
+        self._changed.wait(seconds)
+        self._changed.clear()
+
+# ---------- ÉRTESÍTŐK ----------
+
+# A helyi éjféltől ennyi idő múlva kerülhet sorra egy aznap esedékessé váló növény
+NOT_BEFORE_OFFSET = timedelta(hours=REMINDER_NOT_BEFORE.hour, minutes=REMINDER_NOT_BEFORE.minute)
+
+def _reminder_day(username, now):
+    # A felhasználó helyi napja, ha nála már elmúlt a REMINDER_NOT_BEFORE, különben None
+    local = local_now(get_user_timezone(username), now)
+    return local.date() if local.time() >= REMINDER_NOT_BEFORE else None
+
+def queue_reminders(due, now=None):
+    # Felhasználónként egy értesítő a kimenő sorba; a helyi napra szóló dedup kulcs miatt egy
+    # címzett naponta legfeljebb egyet kap, és a send_reminder cron job is kihagyja.
+    # Visszaadja, kiknek melyik (helyi) napra került sorba értesítő: {username: nap}
+    from mailer import render_reminder, REMINDER_SUBJECT, notify_worker
+    now = now or _now()
+    plants_by_user = {}
+    for _, _, username, name in due:
+        plants_by_user.setdefault(username, []).append(name)
+    queued = {}
+    for username, plant_names in plants_by_user.items():
+        email = get_user_email(username)
+        day = local_today(get_user_timezone(username), now)
+        if not email or is_email_queued(reminder_key(day, email)):
+            continue
+        if enqueue_email(email, REMINDER_SUBJECT, render_reminder(plant_names),
+                         dedup_key=reminder_key(day, email)):
+            queued[username] = day
+    if queued:
+        notify_worker()
+    return queued
+
+def _seconds_until(moment):
+    return max(0.0, (moment - _now()).total_seconds())
+
+def _run_reminders(scheduler):
+    reloaded_day = None
+    reminded = {}  # username -> a helyi nap, amelyen már szóltunk neki
+    while True:
+        try:
+            now = _now()
+            if reloaded_day != now.date():
+                # naponta friss állapot a más folyamatokból jövő módosítások miatt
+                scheduler.reload()
+                reloaded_day = now.date()
+            # a helyi REMINDER_NOT_BEFORE-nál korábban esedékessé vált növények; akinél a helyi
+            # idő még korábbi (pl. egy előző napról maradt növénynél), az a következő körben jön
+            days = {}
+            due = []
+            for item in scheduler.due_before(now - NOT_BEFORE_OFFSET):
+                username = item[2]
+                if username not in days:
+                    days[username] = _reminder_day(username, now)
+                if days[username] is not None and reminded.get(username) != days[username]:
+                    due.append(item)
+            if due:
+                reminded.update(queue_reminders(due, now))
+            # ébredés a következő esedékességkor, de legkésőbb MAX_SLEEP múlva (napváltás miatt)
+            wake = scheduler.next_due()
+            if wake is not None:
+                wake += NOT_BEFORE_OFFSET
+            sleep = MAX_SLEEP if wake is None or wake <= now else min(MAX_SLEEP, _seconds_until(wake))
+            scheduler.wait(sleep)
+        except Exception as e:
+            # a szál nem állhat le; a következő körben újra próbálja
+            print(f"Hiba az esedékes növények értesítőinél: {e}")
+            scheduler.wait(MAX_SLEEP)
+
+_scheduler = None
+_thread = None
+_scheduler_lock = threading.Lock()
+
+def get_scheduler(db_name=DB_NAME):
+    # Folyamatonként egy ütemező, ami a database változás értesítéseiből frissül
+    global _scheduler
+    with _scheduler_lock:
+        if _scheduler is None:
+            _scheduler = DueScheduler(db_name)
+            add_plant_listener(_scheduler.refresh)
+        return _scheduler
+
+def start_reminders(db_name=DB_NAME):
+    # Folyamatonként egy háttérszál, ami az esedékessé váló növényekről értesítőt tesz a sorba
+    global _thread
+    scheduler = get_scheduler(db_name)
+    with _scheduler_lock:
+        if _thread is not None and _thread.is_alive():
+            return
+        _thread = threading.Thread(target=_run_reminders, args=(scheduler,),
+                                   name="due-reminders", daemon=True)
+        _thread.start()
@@ -0,0 +1,284 @@
+import smtplib
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from email.mime.text import MIMEText
+from database import get_pending_emails, mark_email_sent, mark_email_failed
+from metrics import instrumented, timed
+
+# A háttérszál ennyi másodpercenként akkor is ránéz a sorra, ha senki nem ébresztette fel
+POLL_INTERVAL = 30
+MAX_ATTEMPTS = 5
+
+# Küldési korlátok: legfeljebb ennyi levél másodpercenként, átmeneti hibánál
+# ennyi újrapróbálás BACKOFF_BASE * 2^n másodperces várakozással
+RATE_PER_SECOND = 10
+MAX_RETRIES = 3
+BACKOFF_BASE = 1.0
+SMTP_TIMEOUT = 30
+# send_batch_async: ennyi SMTP kapcsolat dolgozik egyszerre
+SMTP_CONNECTIONS = 4
+
+_worker = None
+_worker_lock = threading.Lock()
+_wakeup = threading.Event()
+
+# ---------- SMTP MUNKAMENET ----------
+
+REMINDER_SUBJECT = "Növény öntözési emlékeztető"
+
+def render_reminder(plant_names):
+    return "Ma még öntözni kell ezeken a növényeken:\n" + \
+           "\n".join([f"- {name}" for name in plant_names])
+
+def build_message(sender_email, recipient, subject, body):
+    msg = MIMEText(body, 'plain')
+    msg['From'] = sender_email
+    msg['To'] = recipient
+    msg['Subject'] = subject
+    return msg
+
+@instrumented("mailer.connect")
+def _connect(sender_email, sender_password, smtp_server, smtp_port, use_ssl):
+    # use_ssl=False egy helyi teszt SMTP szerverhez (pl. python -m aiosmtpd -n)
+    smtp_class = smtplib.SMTP_SSL if use_ssl else smtplib.SMTP
+    server = smtp_class(smtp_server, smtp_port, timeout=SMTP_TIMEOUT)
+    if sender_password:
+        server.login(sender_email, sender_password)
+    return server
+
+def _close(server):
+    try:
+        server.quit()
+    except (smtplib.SMTPException, OSError):
+        server.close()
+
+def _is_disconnect(error):
+    # az SMTPException is OSError, ezért a hálózati hibákat külön kell választani
+    return (isinstance(error, smtplib.SMTPServerDisconnected)
+            or not isinstance(error, smtplib.SMTPException))
+
+def _is_transient(error):
+    # 4xx SMTP válaszok és megszakadt kapcsolat: érdemes újrapróbálni
+    if isinstance(error, smtplib.SMTPRecipientsRefused):
+        return all(400 <= code < 500 for code, _ in error.recipients.values())
+    if isinstance(error, smtplib.SMTPResponseException):
+        return 400 <= error.smtp_code < 500
+    return _is_disconnect(error)
+
+def send_batch(messages, sender_email, sender_password,
+               smtp_server="smtp.gmail.com", smtp_port=465, use_ssl=True,
+               rate_per_second=RATE_PER_SECOND, max_retries=MAX_RETRIES):
+    # messages: (kulcs, címzett, tárgy, szöveg) elemek, akár generátorból is.
+    # Egyetlen bejelentkezett SMTP munkamenetet használ a teljes adagra, és minden
+    # levél után (kulcs, hiba vagy None) párt ad vissza. Hibás jelszónál megszakad.
+    min_interval = 1.0 / rate_per_second if rate_per_second else 0.0
+    last_sent = 0.0
+    server = None
+    try:
+        for key, recipient, subject, body in messages:
+            payload = build_message(sender_email, recipient, subject, body).as_string()
+            error = None
+            for attempt in range(max_retries + 1):
+                wait = last_sent + min_interval - time.monotonic()
+                if wait > 0:
+                    time.sleep(wait)
+                try:
+                    if server is None:
+                        server = _connect(sender_email, sender_password, smtp_server, smtp_port, use_ssl)
+                    with timed("mailer.sendmail"):
+                        server.sendmail(sender_email, [recipient], payload)
+                    last_sent = time.monotonic()
+                    error = None
+                    break
+                except smtplib.SMTPAuthenticationError:
+                    raise
+                except OSError as e:
+                    error = e
+                    if _is_disconnect(e) and server is not None:
+                        server.close()
+                        server = None
+                    if not _is_transient(e) or attempt == max_retries:
+                        break
+                    time.sleep(BACKOFF_BASE * 2 ** attempt)
+            yield key, error
+    finally:
+        if server is not None:
+            _close(server)
+
+def _sendmail(server, sender_email, recipient, payload):
+    with timed("mailer.sendmail"):
+        server.sendmail(sender_email, [recipient], payload)
+
+async def send_batch_async(messages, sender_email, sender_password,
+                           smtp_server="smtp.gmail.com", smtp_port=465, use_ssl=True,
+                           connections=SMTP_CONNECTIONS, rate_per_second=RATE_PER_SECOND,
+                           max_retries=MAX_RETRIES):
+    # A send_batch asyncio változata: ugyanazokat a (kulcs, címzett, tárgy, szöveg) elemeket
+    # `connections` párhuzamos, saját SMTP munkamenettel kézbesíti, és a befejezés sorrendjében
+    # ad vissza (kulcs, hiba vagy None) párokat. Az smtplib hívások szálkészletben futnak, így
+    # a levelenkénti körbejárási idők átfednek. A messages generátor (pl. adatbázis kurzor) egy
+    # külön szálon lép, és legfeljebb 2 * connections levél vár előre renderelve.
+    import asyncio
+
+    loop = asyncio.get_running_loop()
+    smtp_executor = ThreadPoolExecutor(max_workers=connections, thread_name_prefix="smtp")
+    reader = ThreadPoolExecutor(max_workers=1, thread_name_prefix="smtp-messages")
+    pending = asyncio.Queue(maxsize=2 * connections)
+    results = asyncio.Queue()
+    done = object()
+    min_interval = 1.0 / rate_per_second if rate_per_second else 0.0
+    next_slot = 0.0
+
+    async def throttle():
+        # közös ütemezés az összes kapcsolatra: rate_per_second levél másodpercenként összesen
+        nonlocal next_slot
+        now = time.monotonic()
+        slot = max(now, next_slot)
+        next_slot = slot + min_interval
+        if slot > now:
+            await asyncio.sleep(slot - now)
+
+    async def produce():
+        iterator = iter(messages)
+        while True:
+            item = await loop.run_in_executor(reader, next, iterator, done)
+            if item is done:
+                break
+            await pending.put(item)
+        for _ in range(connections):
+            await pending.put(done)
+
+    async def deliver():
+        server = None
+        inflight = None
+
+        async def call(func, *args):
+            # a szálban futó smtplib hívást a megszakítás nem hagyja félbe: a lezárás megvárja
+            nonlocal inflight
+            inflight = loop.run_in_executor(smtp_executor, func, *args)
+            return await asyncio.shield(inflight)
+
+        try:
+            while True:
+                item = await pending.get()
+                if item is done:
+                    return
+                key, recipient, subject, body = item
+                payload = build_message(sender_email, recipient, subject, body).as_string()
+                error = None
+                for attempt in range(max_retries + 1):
+                    await throttle()
+                    try:
+                        if server is None:
+                            server = await call(_connect, sender_email, sender_password,
+                                                smtp_server, smtp_port, use_ssl)
+                        await call(_sendmail, server, sender_email, recipient, payload)
+                        error = None
+                        break
+                    except smtplib.SMTPAuthenticationError:
+                        raise
+                    except OSError as e:
+                        error = e
+                        if _is_disconnect(e) and server is not None:
+                            server.close()
+                            server = None
+                        if not _is_transient(e) or attempt == max_retries:
+                            break
+                        await asyncio.sleep(BACKOFF_BASE * 2 ** attempt)
+                await results.put((key, error))
+        finally:
+            if inflight is not None and not inflight.done():
+                await asyncio.wait([inflight])
+                # megszakított kapcsolódás: a közben felépült munkamenetet is le kell zárni
+                if server is None and not inflight.cancelled() and inflight.exception() is None:
+                    server = inflight.result()
+            if server is not None:
+                await loop.run_in_executor(smtp_executor, _close, server)
+
+    tasks = [asyncio.ensure_future(produce())] + [asyncio.ensure_future(deliver()) for _ in range(connections)]
+
+    async def run():
+        try:
+            await asyncio.gather(*tasks)
+        finally:
+            await results.put(done)
+
+    runner = asyncio.ensure_future(run())
+    try:
+        while True:
+            item = await results.get()
+            if item is done:
+                break
+            yield item
+        await runner  # hibás jelszó esetén itt dobja tovább a kivételt
+    finally:
+        # hiba vagy korai kilépés esetén a többi kapcsolat se dolgozzon tovább
+        for task in tasks + [runner]:
+            task.cancel()
+        # a leállított kézbesítők még QUIT-tel zárják a kapcsolatukat a szálkészletben, ezért
+        # a szálkészletet csak utánuk szabad leállítani
+        await asyncio.gather(*tasks, runner, return_exceptions=True)
+        smtp_executor.shutdown(wait=False)
+        reader.shutdown(wait=False)
+
+@instrumented()
+def send_email(to_emails, subject, body, sender_email, sender_password,
+               smtp_server="smtp.gmail.com", smtp_port=465, use_ssl=True):
+    # Címzettenként külön levél, egy munkamenetben; az első hibát továbbdobja
+    messages = [(email, email, subject, body) for email in to_emails]
+    for _, error in send_batch(messages, sender_email, sender_password,
+                               smtp_server, smtp_port, use_ssl):
+        if error is not None:
+            raise error
+
+# ---------- KÉZBESÍTÉS ----------
+
+@instrumented()
+def deliver_pending(sender_email, sender_password,
+                    smtp_server="smtp.gmail.com", smtp_port=465, use_ssl=True):
+    emails = get_pending_emails()
+    if not emails:
+        return 0
+
+    sent = 0
+    results = send_batch(emails, sender_email, sender_password, smtp_server, smtp_port, use_ssl)
+    for email_id, error in results:
+        if error is None:
+            mark_email_sent(email_id)
+            sent += 1
+        else:
+            mark_email_failed(email_id, str(error), MAX_ATTEMPTS)
+    return sent
+
+# ---------- HÁTTÉRSZÁL ----------
+
+def _run_worker(sender_email, sender_password, smtp_server, smtp_port, use_ssl):
+    while True:
+        _wakeup.wait(POLL_INTERVAL)
+        _wakeup.clear()
+        try:
+            # amíg van függő levél, adagonként ürítjük a sort
+            while deliver_pending(sender_email, sender_password, smtp_server, smtp_port, use_ssl):
+                pass
+        except Exception as e:
+            # a szál nem állhat le; a levelek a sorban maradnak a következő próbálkozásig
+            print(f"Hiba a levelek kézbesítésekor: {e}")
+
+def start_worker(sender_email, sender_password,
+                 smtp_server="smtp.gmail.com", smtp_port=465, use_ssl=True):
+    # Folyamatonként egy kézbesítő szál fut, a további hívások nem csinálnak semmit
+    global _worker
+    with _worker_lock:
+        if _worker is not None and _worker.is_alive():
+            return
+        _worker = threading.Thread(
+            target=_run_worker,
+            args=(sender_email, sender_password, smtp_server, smtp_port, use_ssl),
+            name="mail-outbox-worker",
+            daemon=True,
+        )
+        _worker.start()
+
+def notify_worker():
+    _wakeup.set()
@@ -0,0 +1,266 @@
+import inspect
+import os
+import threading
+import time
+from contextlib import contextmanager
+from functools import wraps
+from time import perf_counter
+
+# Hívásszám, késleltetés hisztogram és visszaadott sorok függvényenként, folyamaton
+# belül összesítve és Streamlit újrafuttatásonként külön is. Kimenetek:
+#   - admin panel a dashboardon (app_logic.show_admin_panel)
+#   - Prometheus szöveges formátum: METRICS_FILE=/var/lib/node_exporter/planttracker.prom
+#   - lassú hívások naplója a futtatott SQL utasításokkal: SLOW_QUERY_MS=100
+
+# Hisztogram határok másodpercben (Prometheus "le" címkék)
+BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+METRICS_FILE = os.environ.get("METRICS_FILE")
+EXPORT_INTERVAL = 60
+SLOW_QUERY_MS = float(os.environ["SLOW_QUERY_MS"]) if os.environ.get("SLOW_QUERY_MS") else None
+# Ennyi SQL utasítást írunk ki egy lassú hívásból
+SLOW_QUERY_STATEMENTS = 10
+
+class Metric:
+    def __init__(self):
+        self.calls = 0
+        self.errors = 0
+        self.seconds = 0.0
+        self.rows = 0
+        self.buckets = [0] * (len(BUCKETS) + 1)  # az utolsó a +Inf
+
+    def observe(self, seconds, rows, error):
+        self.calls += 1
+        self.errors += error
+        self.seconds += seconds
+        self.rows += rows
+        for i, bound in enumerate(BUCKETS):
+            if seconds <= bound:
+                self.buckets[i] += 1
+                return
+        self.buckets[-1] += 1
+
+    def quantile(self, q):
+        # Becslés a hisztogramból: annak a vödörnek a felső határa, ahol a q-adik hívás van
+        if not self.calls:
+            return None
+        rank = q * self.calls
+        seen = 0
+        for bound, count in zip(BUCKETS, self.buckets):
+            seen += count
+            if seen >= rank:
+                return bound
+        return float("inf")
+
+_metrics = {}
+_metrics_lock = threading.Lock()
+# Szálanként: az aktuális újrafuttatás adatai és a hívások egymásba ágyazási mélysége
+_local = threading.local()
+
+def record(name, seconds, rows=0, error=False):
+    with _metrics_lock:
+        metric = _metrics.get(name)
+        if metric is None:
+            metric = _metrics[name] = Metric()
+        metric.observe(seconds, rows, error)
+    rerun = getattr(_local, "rerun", None)
+    if rerun is not None:
+        calls, total, total_rows = rerun["functions"].get(name, (0, 0.0, 0))
+        rerun["functions"][name] = (calls + 1, total + seconds, total_rows + rows)
+        if not getattr(_local, "depth", 0):
+            rerun["instrumented"] += seconds
+
+def snapshot():
+    # {név: (hívások, hibák, összes másodperc, sorok, p50, p95)} a folyamat indulása óta
+    with _metrics_lock:
+        return {
+            name: (m.calls, m.errors, m.seconds, m.rows, m.quantile(0.5), m.quantile(0.95))
+            for name, m in sorted(_metrics.items())
+        }
+
+def reset():
+    with _metrics_lock:
+        _metrics.clear()
+
+# ---------- ÚJRAFUTTATÁSOK ----------
+
+def begin_rerun():
+    # A Streamlit minden újrafuttatást a munkamenet saját szálán végez, így a szálhoz
+    # kötött gyűjtő csak az adott munkamenet hívásait látja
+    _local.rerun = {"started": perf_counter(), "instrumented": 0.0, "functions": {}}
+
+def rerun_stats():
+    # (eltelt idő, mért hívásokban töltött idő, {név: (hívások, másodperc, sorok)}) vagy None;
+    # a kettő különbsége a Streamlit renderelés és a Python kód ideje
+    rerun = getattr(_local, "rerun", None)
+    if rerun is None:
+        return None
+    return perf_counter() - rerun["started"], rerun["instrumented"], dict(rerun["functions"])
+
+# ---------- MÉRŐ WRAPPEREK ----------
+
+def _row_count(value):
+    # fetchall() lista, vagy (sorok, ...) pár, mint a get_plants_page eredménye
+    if isinstance(value, list):
+        return len(value)
+    if isinstance(value, tuple) and value and isinstance(value[0], list):
+        return len(value[0])
+    return 0
+
+def _enter():
+    depth = getattr(_local, "depth", 0)
+    _local.depth = depth + 1
+    if depth == 0 and SLOW_QUERY_MS is not None:
+        _local.statements = []
+    return depth
+
+def _exit(name, depth, seconds, rows, error):
+    _local.depth = depth
+    record(name, seconds, rows, error)
+    if depth == 0 and SLOW_QUERY_MS is not None:
+        statements = _local.statements
+        _local.statements = None
+        if seconds * 1000 >= SLOW_QUERY_MS:
+            _log_slow_call(name, seconds, statements)
+
+def instrumented(name=None):
+    def decorator(func):
+        metric_name = name or f"{func.__module__}.{func.__name__}"
+
+        if inspect.isgeneratorfunction(func):
+            # Csak a generátorban töltött időt mérjük, a fogyasztóét (pl. levélküldés) nem
+            @wraps(func)
+            def generator_wrapper(*args, **kwargs):
+                iterator = func(*args, **kwargs)
+                seconds = 0.0
+                rows = 0
+                error = False
+                try:
+                    while True:
+                        _local.depth = getattr(_local, "depth", 0) + 1
+                        started = perf_counter()
+                        try:
+                            item = next(iterator)
+                        except StopIteration:
+                            return
+                        except BaseException:
+                            error = True
+                            raise
+                        finally:
+                            seconds += perf_counter() - started
+                            _local.depth -= 1
+                        rows += 1
+                        yield item
+                finally:
+                    iterator.close()
+                    record(metric_name, seconds, rows, error)
+                    if SLOW_QUERY_MS is not None and seconds * 1000 >= SLOW_QUERY_MS:
+                        _log_slow_call(metric_name, seconds, None)
+            return generator_wrapper
+
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            depth = _enter()
+            started = perf_counter()
+            try:
+                value = func(*args, **kwargs)
+            except BaseException:
+                _exit(metric_name, depth, perf_counter() - started, 0, True)
+                raise
+            _exit(metric_name, depth, perf_counter() - started, _row_count(value), False)
+            return value
+        return wrapper
+    return decorator
+
+@contextmanager
+def timed(name):
+    # Egy kódrészlet mérése, ha nem külön függvény (pl. egyetlen SMTP parancs)
+    depth = _enter()
+    started = perf_counter()
+    try:
+        yield
+    except BaseException:
+        _exit(name, depth, perf_counter() - started, 0, True)
+        raise
+    _exit(name, depth, perf_counter() - started, 0, False)
+
+def instrument_module(namespace, exclude=()):
+    # A modul összes publikus függvényét lecseréli a mért változatára. A modul végén kell
+    # meghívni globals()-szal, hogy a többi modul importja már a mért függvényt kapja meg.
+    module = namespace["__name__"]
+    for name, value in list(namespace.items()):
+        if (inspect.isfunction(value) and value.__module__ == module
+                and not name.startswith("_") and name not in exclude):
+            namespace[name] = instrumented(f"{module}.{name}")(value)
+
+# ---------- SQLITE TRACE ----------
+
+def trace_statement(statement):
+    # sqlite3 set_trace_callback: a mért hívás közben futtatott utasításokat gyűjti
+    statements = getattr(_local, "statements", None)
+    if statements is not None and len(statements) < SLOW_QUERY_STATEMENTS:
+        statements.append(" ".join(statement.split()))
+
+def _log_slow_call(name, seconds, statements):
+    print(f"Lassú hívás: {name} {seconds * 1000:.1f} ms")
+    for statement in statements or ():
+        print(f"    {statement[:500]}")
+
+# ---------- PROMETHEUS EXPORT ----------
+
+def _format_bound(bound):
+    return "+Inf" if bound == float("inf") else repr(bound)
+
+def export_prometheus():
+    lines = [
+        "# HELP planttracker_call_duration_seconds Függvényhívások időtartama.",
+        "# TYPE planttracker_call_duration_seconds histogram",
+    ]
+    with _metrics_lock:
+        metrics = sorted((name, m.calls, m.errors, m.seconds, m.rows, list(m.buckets))
+                         for name, m in _metrics.items())
+    for name, calls, errors, seconds, rows, buckets in metrics:
+        cumulative = 0
+        for bound, count in zip(BUCKETS + (float("inf"),), buckets):
+            cumulative += count
+            lines.append(f'planttracker_call_duration_seconds_bucket{{function="{name}",'
+                         f'le="{_format_bound(bound)}"}} {cumulative}')
+        lines.append(f'planttracker_call_duration_seconds_sum{{function="{name}"}} {seconds}')
+        lines.append(f'planttracker_call_duration_seconds_count{{function="{name}"}} {calls}')
+    lines += ["# HELP planttracker_call_errors_total Kivétellel végződött hívások.",
+              "# TYPE planttracker_call_errors_total counter"]
+    lines += [f'planttracker_call_errors_total{{function="{m[0]}"}} {m[2]}' for m in metrics]
+    lines += ["# HELP planttracker_rows_total A hívások által visszaadott sorok.",
+              "# TYPE planttracker_rows_total counter"]
+    lines += [f'planttracker_rows_total{{function="{m[0]}"}} {m[4]}' for m in metrics]
+    return "\n".join(lines) + "\n"
+
+def write_prometheus(path=METRICS_FILE):
+    # Atomi csere, hogy a node_exporter textfile gyűjtője sose lásson félig írt fájlt
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        f.write(export_prometheus())
+    os.replace(tmp_path, path)
+
+_exporter = None
+_exporter_lock = threading.Lock()
+
+def _run_exporter(path, interval):
+    while True:
+        time.sleep(interval)
+        try:
+            write_prometheus(path)
+        except OSError as e:
+            print(f"Hiba a metrikák kiírásakor: {e}")
+
+def start_exporter(path=METRICS_FILE, interval=EXPORT_INTERVAL):
+    # Folyamatonként egy szál írja ki a metrikákat; METRICS_FILE nélkül nem csinál semmit
+    global _exporter
+    if not path:
+        return
+    with _exporter_lock:
+        if _exporter is not None and _exporter.is_alive():
+            return
+        _exporter = threading.Thread(target=_run_exporter, args=(path, interval),
+                                     name="metrics-exporter", daemon=True)
+        _exporter.start()
@@ -0,0 +1,50 @@
+from datetime import date
+
+# Tömör sorobjektumok a pozíció szerint indexelt tuple-ök helyett (__slots__: nincs
+# példányonkénti __dict__). A dátumok egész nap sorszámként (date.toordinal()) érkeznek
+# az adatbázisból (lásd database._convert_day), így az esedékesség vizsgálata egész
+# összehasonlítás, date objektum csak kiíráskor készül.
+
+def day_to_date(ordinal):
+    return None if ordinal is None else date.fromordinal(ordinal)
+
+def day_to_text(ordinal):
+    # Az adatbázisban tárolt "ÉÉÉÉ-HH-NN" alak, pl. SQL paraméternek
+    return None if ordinal is None else date.fromordinal(ordinal).isoformat()
+
+class WateringLog:
+    __slots__ = ("plant_id", "watered_by", "watered_at")
+
+    def __init__(self, plant_id, watered_by, watered_at):
+        self.plant_id = plant_id
+        self.watered_by = watered_by
+        self.watered_at = watered_at  # "ÉÉÉÉ-HH-NN ÓÓ:PP:MM"
+
+    def __repr__(self):
+        return f"WateringLog({self.plant_id!r}, {self.watered_by!r}, {self.watered_at!r})"
+
+class Plant:
+    __slots__ = ("id", "username", "name", "frequency_days", "last_watered", "next_due", "due", "last_log")
+
+    def __init__(self, id, username, name, frequency_days, last_watered, next_due=None,
+                 due=False, last_log=None):
+        self.id = id
+        self.username = username
+        self.name = name
+        self.frequency_days = frequency_days
+        self.last_watered = last_watered  # nap sorszám vagy None
+        self.next_due = next_due          # nap sorszám vagy None
+        self.due = due                    # a lekérdezés napján esedékes-e (a tulajdonosnak)
+        self.last_log = last_log          # a legutolsó WateringLog vagy None
+
+    @property
+    def last_watered_date(self):
+        return day_to_date(self.last_watered)
+
+    @property
+    def next_due_date(self):
+        return day_to_date(self.next_due)
+
+    def __repr__(self):
+        return (f"Plant({self.id!r}, {self.username!r}, {self.name!r}, {self.frequency_days!r}, "
+                f"{self.last_watered_date!r}, {self.next_due_date!r})")
@@ -0,0 +1,119 @@
+import argparse
+import base64
+import hashlib
+import hmac
+import os
+import secrets
+from concurrent.futures import ThreadPoolExecutor
+from time import perf_counter
+
+# Sózott, hangolható jelszó hash. Tárolt formátumok:
+#   scrypt$N$r$p$só$hash          (alapértelmezett)
+#   pbkdf2_sha256$iteráció$só$hash (ha az OpenSSL nem támogatja a scrypt-et)
+#   64 hexa karakter               (régi, sózatlan SHA-256; belépéskor lecseréljük)
+# A költség környezeti változókkal állítható, az értékét a `python passwords.py` mérés javasolja.
+SCRYPT_N = int(os.environ.get("PASSWORD_SCRYPT_N", str(2 ** 14)))
+SCRYPT_R = int(os.environ.get("PASSWORD_SCRYPT_R", "8"))
+SCRYPT_P = int(os.environ.get("PASSWORD_SCRYPT_P", "1"))
+PBKDF2_ITERATIONS = int(os.environ.get("PASSWORD_PBKDF2_ITERATIONS", "600000"))
+SALT_BYTES = 16
+HASH_BYTES = 32
+
+ALGORITHM = "scrypt" if hasattr(hashlib, "scrypt") else "pbkdf2_sha256"
+
+# A KDF a GIL elengedésével fut, de egyenként sok CPU-t és (scrypt esetén) 128*N*r bájt
+# memóriát használ. A közös, korlátos szálkészlet miatt egyszerre legfeljebb ennyi fut,
+# a többi Streamlit munkamenet újrafuttatásai nem akadnak el a bejelentkezések mögött.
+KDF_WORKERS = int(os.environ.get("PASSWORD_KDF_WORKERS", "2"))
+_executor = ThreadPoolExecutor(max_workers=KDF_WORKERS, thread_name_prefix="password-kdf")
+
+def _b64(data):
+    return base64.b64encode(data).decode("ascii")
+
+def _derive(algorithm, password, salt, params):
+    if algorithm == "scrypt":
+        n, r, p = params
+        return hashlib.scrypt(password.encode(), salt=salt, n=n, r=r, p=p,
+                              maxmem=256 * n * r, dklen=HASH_BYTES)
+    (iterations,) = params
+    return hashlib.pbkdf2_hmac("sha256", password.encode(), salt, iterations, dklen=HASH_BYTES)
+
+def _current_params():
+    if ALGORITHM == "scrypt":
+        return (SCRYPT_N, SCRYPT_R, SCRYPT_P)
+    return (PBKDF2_ITERATIONS,)
+
+def _hash_password(password):
+    salt = secrets.token_bytes(SALT_BYTES)
+    params = _current_params()
+    digest = _derive(ALGORITHM, password, salt, params)
+    return "$".join([ALGORITHM, *map(str, params), _b64(salt), _b64(digest)])
+
+def _verify_password(input_password, stored_password):
+    if not stored_password:
+        return False
+    parts = stored_password.split("$")
+    if len(parts) == 1:
+        legacy = hashlib.sha256(input_password.encode()).hexdigest()
+        return hmac.compare_digest(legacy, stored_password)
+    algorithm, *params, salt, digest = parts
+    if algorithm not in ("scrypt", "pbkdf2_sha256"):
+        return False
+    expected = base64.b64decode(digest)
+    actual = _derive(algorithm, input_password, base64.b64decode(salt), tuple(map(int, params)))
+    return hmac.compare_digest(actual, expected)
+
+def hash_password(password):
+    return _executor.submit(_hash_password, password).result()
+
+def verify_password(input_password, stored_password):
+    return _executor.submit(_verify_password, input_password, stored_password).result()
+
+def needs_rehash(stored_password):
+    # Régi SHA-256 hash, más algoritmus vagy elavult költség: sikeres belépéskor újra kell hash-elni
+    parts = (stored_password or "").split("$")
+    return parts[0] != ALGORITHM or tuple(map(int, parts[1:-2])) != _current_params()
+
+# ---------- KÖLTSÉG MÉRÉS ----------
+
+def _time_hash(params, rounds=3):
+    salt = secrets.token_bytes(SALT_BYTES)
+    best = None
+    for _ in range(rounds):
+        started = perf_counter()
+        _derive(ALGORITHM, "benchmark-password", salt, params)
+        elapsed = perf_counter() - started
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+def calibrate(target_ms=250):
+    # A legnagyobb költség, aminél egy hash ezen a gépen még a cél időn belül marad.
+    # Visszaad: (paraméterek, mért idő ms-ban)
+    target = target_ms / 1000
+    if ALGORITHM == "scrypt":
+        n = 2 ** 12
+        while _time_hash((n * 2, SCRYPT_R, SCRYPT_P)) <= target and n < 2 ** 20:
+            n *= 2
+        params = (n, SCRYPT_R, SCRYPT_P)
+    else:
+        iterations = 100000
+        elapsed = _time_hash((iterations,))
+        iterations = max(100000, int(iterations * target / elapsed) // 10000 * 10000)
+        params = (iterations,)
+    return params, _time_hash(params) * 1000
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Jelszó hash költségének kimérése erre a gépre.")
+    parser.add_argument("--target-ms", type=float, default=250,
+                        help="ennyi ideig tartson egy bejelentkezés jelszó ellenőrzése (ms)")
+    args = parser.parse_args(argv)
+
+    params, elapsed_ms = calibrate(args.target_ms)
+    print(f"Algoritmus: {ALGORITHM}, mért idő: {elapsed_ms:.0f} ms")
+    if ALGORITHM == "scrypt":
+        print(f"PASSWORD_SCRYPT_N={params[0]} PASSWORD_SCRYPT_R={params[1]} PASSWORD_SCRYPT_P={params[2]}")
+    else:
+        print(f"PASSWORD_PBKDF2_ITERATIONS={params[0]}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,53 @@
+import csv
+import io
+import json
+from datetime import date
+
+# Tömeges növény import CSV vagy JSON fájlból.
+# CSV: fejléc sorral, oszlopok: name, frequency_days, last_watered (opcionális, ÉÉÉÉ-HH-NN)
+# JSON: objektumok listája ugyanezekkel a kulcsokkal
+# Az eredmény database.import_plants() bemenete: (name, frequency_days, last_watered) elemek.
+
+MIN_FREQUENCY = 1
+MAX_FREQUENCY = 365
+
+def _parse_record(number, record):
+    name = str(record.get("name") or "").strip()
+    if not name:
+        raise ValueError(f"{number}. sor: hiányzó növénynév.")
+
+    try:
+        frequency_days = int(record.get("frequency_days"))
+    except (TypeError, ValueError):
+        raise ValueError(f"{number}. sor: érvénytelen öntözési gyakoriság.") from None
+    if not MIN_FREQUENCY <= frequency_days <= MAX_FREQUENCY:
+        raise ValueError(f"{number}. sor: a gyakoriság {MIN_FREQUENCY} és {MAX_FREQUENCY} nap közé kell essen.")
+
+    last_watered = str(record.get("last_watered") or "").strip() or None
+    if last_watered:
+        # az adatbázisba csak kanonikus ÉÉÉÉ-HH-NN kerülhet (pl. a "2026-1-5" alakkal a
+        # SQLite date() NULL-t adna)
+        try:
+            last_watered = date.fromisoformat(last_watered).isoformat()
+        except ValueError:
+            raise ValueError(f"{number}. sor: a last_watered formátuma ÉÉÉÉ-HH-NN kell legyen.") from None
+
+    return name, frequency_days, last_watered
+
+def read_plants_csv(text):
+    reader = csv.DictReader(io.StringIO(text))
+    return [_parse_record(number, record) for number, record in enumerate(reader, start=1)]
+
+def read_plants_json(text):
+    try:
+        records = json.loads(text)
+    except json.JSONDecodeError as e:
+        raise ValueError(f"Hibás JSON: {e}") from None
+    if not isinstance(records, list) or not all(isinstance(r, dict) for r in records):
+        raise ValueError("A JSON fájlnak objektumok listáját kell tartalmaznia.")
+    return [_parse_record(number, record) for number, record in enumerate(records, start=1)]
+
+def read_plants(filename, text):
+    if filename.lower().endswith(".json"):
+        return read_plants_json(text)
+    return read_plants_csv(text)
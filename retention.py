@@ -0,0 +1,179 @@
+import argparse
+import csv
+import gzip
+import os
+import threading
+import time
+from datetime import datetime, timedelta
+from database import DB_NAME, get_connection, write_transaction, invalidate, init_db
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+ARCHIVE_DIR = os.path.join(BASE_DIR, "archive")
+
+# Ennyi napnál régebbi napló bejegyzések kerülnek archívumba
+RETENTION_DAYS = 365
+# Az alkalmazás ennyi naponta futtatja le magától a karbantartást
+MAINTENANCE_INTERVAL_DAYS = 7
+# A háttérszál ilyen gyakran nézi meg, esedékes-e a karbantartás (másodperc)
+CHECK_INTERVAL = 6 * 60 * 60
+
+ARCHIVE_COLUMNS = ["id", "plant_id", "watered_by", "watered_at"]
+# Ennyi archivált bejegyzés összesítése és törlése kerül egy írási tranzakcióba
+ARCHIVE_BATCH = 5000
+
+_scheduler = None
+_scheduler_lock = threading.Lock()
+
+# ---------- ARCHIVÁLÁS ----------
+
+def _old_logs_condition():
+    # Növényenként a legutolsó bejegyzés mindig marad, különben az "Utolsó öntöző" adat elveszne
+    return """
+        watered_at < :cutoff
+        AND id NOT IN (SELECT max(id) FROM watering_logs GROUP BY plant_id)
+    """
+
+def _archive_batch(db_name, ids):
+    # Egy adag már kiírt bejegyzés havi összesítése és törlése egy rövid írási tranzakcióban
+    with write_transaction(db_name) as conn:
+        conn.execute("CREATE TEMP TABLE IF NOT EXISTS archive_ids (id INTEGER PRIMARY KEY)")
+        conn.execute("DELETE FROM temp.archive_ids")
+        conn.executemany("INSERT INTO temp.archive_ids (id) VALUES (?)", ((i,) for i in ids))
+        conn.execute("""
+            INSERT INTO watering_monthly (plant_id, month, waterings, first_watered_at, last_watered_at)
+            SELECT plant_id, strftime('%Y-%m', watered_at), COUNT(*), MIN(watered_at), MAX(watered_at)
+            FROM watering_logs
+            WHERE id IN (SELECT id FROM temp.archive_ids)
+            GROUP BY 1, 2
+            ON CONFLICT (plant_id, month) DO UPDATE SET
+                waterings = waterings + excluded.waterings,
+                first_watered_at = min(first_watered_at, excluded.first_watered_at),
+                last_watered_at = max(last_watered_at, excluded.last_watered_at)
+        """)
+        conn.execute("DELETE FROM watering_logs WHERE id IN (SELECT id FROM temp.archive_ids)")
+        conn.execute("DELETE FROM temp.archive_ids")
+
+def archive_old_logs(retention_days=RETENTION_DAYS, archive_dir=ARCHIVE_DIR, db_name=DB_NAME):
+    # A régi bejegyzéseket havonta külön, hozzáfűzhető gzip CSV fájlba írja
+    # (watering_logs-ÉÉÉÉ-HH.csv.gz, minden futás új gzip tagot fűz a végére),
+    # havi összesítőt készít róluk a watering_monthly táblába, majd törli őket.
+    # A kiírás egy olvasó kurzorról megy (WAL módban az alkalmazás írásait nem tartja fel),
+    # az összesítés és a törlés pedig ARCHIVE_BATCH bejegyzésenként egy rövid írási
+    # tranzakció, csak a már kiírt (és a fájlba ürített) id-kre.
+    # Ha a törlés előtt megszakad, a következő futás ugyanazokat a sorokat újra kiírja;
+    # az archívum olvasásakor az id oszlop alapján lehet szűrni az ismétlődést.
+    cutoff = (datetime.now() - timedelta(days=retention_days)).strftime("%Y-%m-%d")
+    os.makedirs(archive_dir, exist_ok=True)
+
+    files = {}
+    batch = []
+    archived = 0
+
+    def flush():
+        for handle, _ in files.values():
+            handle.flush()
+        _archive_batch(db_name, batch)
+        batch.clear()
+
+    try:
+        with get_connection(db_name) as conn:
+            rows = conn.execute(f"""
+                SELECT {', '.join(ARCHIVE_COLUMNS)} FROM watering_logs
+                WHERE {_old_logs_condition()}
+                ORDER BY watered_at, id
+            """, {"cutoff": cutoff})
+            for row in rows:
+                month = row[3][:7]
+                if month not in files:
+                    path = os.path.join(archive_dir, f"watering_logs-{month}.csv.gz")
+                    handle = gzip.open(path, "at", newline="", encoding="utf-8")
+                    files[month] = (handle, csv.writer(handle))
+                files[month][1].writerow(row)
+                batch.append(row[0])
+                archived += 1
+                if len(batch) >= ARCHIVE_BATCH:
+                    flush()
+        if batch:
+            flush()
+    finally:
+        for handle, _ in files.values():
+            handle.close()
+        if archived:
+            invalidate("watering_logs")
+    return archived
+
+def read_archive(path):
+    # Egy archív fájl sorai (id szerint egyedítve), a napló oszlopsorrendjében
+    seen = set()
+    with gzip.open(path, "rt", newline="", encoding="utf-8") as handle:
+        for row in csv.reader(handle):
+            if row[0] not in seen:
+                seen.add(row[0])
+                yield int(row[0]), int(row[1]), row[2], row[3]
+
+# ---------- KARBANTARTÁS ----------
+
+def optimize_database(db_name=DB_NAME, vacuum=False):
+    # ANALYZE a lekérdezéstervező statisztikáihoz, WAL checkpoint, opcionálisan VACUUM
+    with get_connection(db_name) as conn:
+        conn.execute("ANALYZE")
+        conn.execute("PRAGMA optimize")
+        conn.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+        if vacuum:
+            conn.execute("VACUUM")
+
+def run_maintenance(retention_days=RETENTION_DAYS, archive_dir=ARCHIVE_DIR, db_name=DB_NAME, vacuum=True):
+    archived = archive_old_logs(retention_days, archive_dir, db_name)
+    optimize_database(db_name, vacuum=vacuum and archived > 0)
+    with write_transaction(db_name) as conn:
+        conn.execute("""
+            INSERT INTO maintenance_runs (task, last_run) VALUES ('retention', ?)
+            ON CONFLICT (task) DO UPDATE SET last_run = excluded.last_run
+        """, (datetime.now().strftime("%Y-%m-%d %H:%M:%S"),))
+    return archived
+
+def maintenance_due(db_name=DB_NAME, interval_days=MAINTENANCE_INTERVAL_DAYS):
+    with get_connection(db_name) as conn:
+        row = conn.execute("SELECT last_run FROM maintenance_runs WHERE task = 'retention'").fetchone()
+    if row is None:
+        return True
+    last_run = datetime.strptime(row[0], "%Y-%m-%d %H:%M:%S")
+    return datetime.now() - last_run >= timedelta(days=interval_days)
+
+def _run_scheduler(db_name):
+    while True:
+        try:
+            if maintenance_due(db_name):
+                # VACUUM nélkül: az egész futása alatt fogná az írási zárat, és az alkalmazás
+                # írásai "database is locked" hibával elakadnának; azt a python retention.py végzi
+                archived = run_maintenance(db_name=db_name, vacuum=False)
+                print(f"Karbantartás kész, {archived} napló bejegyzés archiválva.")
+        except Exception as e:
+            print(f"Hiba a karbantartás közben: {e}")
+        time.sleep(CHECK_INTERVAL)
+
+def start_scheduler(db_name=DB_NAME):
+    # Folyamatonként egy háttérszál, ami MAINTENANCE_INTERVAL_DAYS naponta lefuttatja a karbantartást
+    global _scheduler
+    with _scheduler_lock:
+        if _scheduler is not None and _scheduler.is_alive():
+            return
+        _scheduler = threading.Thread(target=_run_scheduler, args=(db_name,),
+                                      name="maintenance-scheduler", daemon=True)
+        _scheduler.start()
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Régi öntözési napló archiválása és adatbázis karbantartás.")
+    parser.add_argument("--days", type=int, default=RETENTION_DAYS,
+                        help="ennyi napnál régebbi bejegyzések kerülnek archívumba")
+    parser.add_argument("--archive-dir", default=ARCHIVE_DIR, help="az archív fájlok könyvtára")
+    parser.add_argument("--db", default=os.path.join(BASE_DIR, DB_NAME), help="a plants adatbázis fájl")
+    parser.add_argument("--no-vacuum", action="store_true", help="VACUUM kihagyása")
+    args = parser.parse_args(argv)
+
+    init_db(args.db)
+    archived = run_maintenance(args.days, args.archive_dir, args.db, vacuum=not args.no_vacuum)
+    print(f"{archived} napló bejegyzés archiválva.")
+
+if __name__ == "__main__":
+    main()
@@ -1,90 +1,205 @@
-import sqlite3
-import smtplib
-from datetime import datetime, timedelta, time
-from email.mime.multipart import MIMEMultipart
-from email.mime.text import MIMEText
+import argparse
+import asyncio
+import multiprocessing
+from contextlib import contextmanager
+from time import monotonic
+from datetime import datetime, time, timezone
 import os
+from database import close_all_connections, open_snapshot
+from repository import open_repository, sqlite_path
+from mailer import send_batch, send_batch_async, render_reminder, REMINDER_SUBJECT, RATE_PER_SECOND
+from metrics import METRICS_FILE, write_prometheus
 
 BASE_DIR = os.path.dirname(os.path.abspath(__file__))
 DB_NAME_PLANTS = os.path.join(BASE_DIR, "plants.db")
-DB_NAME_USERS = os.path.join(BASE_DIR, "users.db")
-
-def get_all_plants():
-    conn = sqlite3.connect(DB_NAME_PLANTS)
-    cur = conn.cursor()
-    cur.execute("SELECT * FROM plants")
-    plants = cur.fetchall()
-    conn.close()
-    return plants
-
-def get_all_user_emails():
-    conn = sqlite3.connect(DB_NAME_USERS)
-    cur = conn.cursor()
-    cur.execute("SELECT email FROM users WHERE email IS NOT NULL AND email != ''")
-    emails = [row[0] for row in cur.fetchall()]
-    conn.close()
-    return emails
-
-def watered_today(plant):
-    last_watered_str = plant[4]
-    if not last_watered_str:
+# Szerver oldali adatbázishoz: DATABASE_URL=postgresql://... (lásd repository.py)
+DATABASE_URL = os.environ.get("DATABASE_URL", DB_NAME_PLANTS)
+
+# Az elküldött értesítők nyilvántartása (dedup); alapból ugyanaz az adatbázis. GitHub Actions
+# alatt a checkout plants.db-je minden futás után elveszik, ezért ott egy külön, a futások között
+# cache-ben megőrzött SQLite fájl (lásd .github/workflows/email_reminder.yml)
+SENT_DATABASE_URL = os.environ.get("SENT_DATABASE_URL", DATABASE_URL)
+
+# Helyi teszt SMTP szerverhez: SMTP_SERVER=localhost SMTP_PORT=8025 SMTP_USE_SSL=0
+SMTP_SERVER = os.environ.get("SMTP_SERVER", "smtp.gmail.com")
+SMTP_PORT = int(os.environ.get("SMTP_PORT", "465"))
+SMTP_USE_SSL = os.environ.get("SMTP_USE_SSL", "1") != "0"
+# Levelek másodpercenként; 0 = korlátlan (csak helyi teszt szerverhez)
+SMTP_RATE_PER_SECOND = float(os.environ.get("SMTP_RATE_PER_SECOND", str(RATE_PER_SECOND)))
+
+# A job óránként fut (lásd .github/workflows/email_reminder.yml): az a felhasználó kap levelet,
+# akinél a helyi idő már legalább REMINDER_TIME, és aznap (helyi nap) még nem kapott értesítőt.
+# Az elküldött levelek a reminder_key kulccsal rögzülnek (SENT_DATABASE_URL), így egy késve
+# futó, kimaradt vagy kézzel indított futás sem hagy ki és nem is küld kétszer senkit.
+REMINDER_TIME = time.fromisoformat(os.environ.get("REMINDER_TIME", "18:00"))
+
+def _report(repository, key, error):
+    # key: (email, helyi nap, levél szövege); a sikeres küldés rögzül a dedup kulccsal
+    email, day, body = key
+    if error is not None:
+        print(f"Nem sikerült elküldeni a(z) {email} címre: {error}")
         return False
-    last_watered_date = datetime.strptime(last_watered_str, "%Y-%m-%d").date()
-    return last_watered_date == datetime.now().date()
-
-def send_email(to_emails, subject, body, sender_email, sender_password,
-               smtp_server="smtp.gmail.com", smtp_port=465):
-    msg = MIMEMultipart()
-    msg['From'] = sender_email
-    msg['To'] = ", ".join(to_emails)
-    msg['Subject'] = subject
-    msg.attach(MIMEText(body, 'plain'))
-    with smtplib.SMTP_SSL(smtp_server, smtp_port) as server:
-        server.login(sender_email, sender_password)
-        server.sendmail(sender_email, to_emails, msg.as_string())
-
-def main():
-    now = datetime.now()
-    if now.time() < time(18, 0):
-        print("Még nincs itt az idő az email küldéshez.")
-        return
+    repository.mark_reminded(email, day, REMINDER_SUBJECT, body)
+    return True
 
-    plants = get_all_plants()
-    due_plants = []
-    for p in plants:
-        last_watered = p[4]
-        freq = p[3]
-        if not last_watered:
-            due_plants.append(p)
-            continue
-        last_date = datetime.strptime(last_watered, "%Y-%m-%d")
-        if now.date() >= (last_date + timedelta(days=freq)).date():
-            due_plants.append(p)
-
-    not_watered = [p for p in due_plants if not watered_today(p)]
-
-    if not not_watered:
-        print("Nincs ma öntözendő növény vagy már mind meg lett öntözve.")
-        return
+async def _send_concurrently(messages, repository, sender_email, sender_password, connections):
+    sent = 0
+    async for key, error in send_batch_async(messages, sender_email, sender_password,
+                                             SMTP_SERVER, SMTP_PORT, SMTP_USE_SSL,
+                                             connections, SMTP_RATE_PER_SECOND):
+        sent += _report(repository, key, error)
+    return sent
+
+def run_shard(now, shard_count, shard_index, sender_email, sender_password, connections=1,
+              not_before=REMINDER_TIME, database_url=DATABASE_URL, sent_database_url=SENT_DATABASE_URL):
+    # Egy szelet felhasználóinak kiszámolja és elküldi az értesítőit, majd összesítőt ad vissza.
+    # Folyamatos feldolgozás: a kurzorról felhasználónként érkező adag rögtön levél lesz,
+    # a teljes növénylista sosem kerül a memóriába. A ma öntözött növények next_due értéke
+    # már a jövőben van, ezért külön szűrni sem kell őket. A "ma" mindenkinél a saját
+    # időzónája szerinti nap; not_before=None esetén a helyi időt sem nézzük. Az elküldött
+    # levelek mindig a sent_database_url adatbázisba rögzülnek (pillanatképből olvasva is).
+    started = monotonic()
+    subject = REMINDER_SUBJECT
+    total = 0
+    repository = open_repository(database_url)
+    # A rögzítés mindig külön repositoryn megy: PostgreSQL-nél az iter_due_reminders kurzora
+    # egy tranzakcióban fut, és ugyanazon a kapcsolaton egy megszakadt futás a már elküldött
+    # levelek rögzítését is visszagörgetné (a live saját, autocommit kapcsolatot nyit)
+    live = open_repository(sent_database_url)
+
+    def was_reminded(email, day):
+        # az alkalmazás által sorba tett értesítők az olvasott adatbázis outboxában vannak
+        return repository.was_reminded(email, day) or (
+            sent_database_url != database_url and live.was_reminded(email, day))
+
+    def messages():
+        nonlocal total
+        batches = repository.iter_due_reminders(now, shard_count, shard_index, not_before)
+        for username, email, plant_names, day in batches:
+            if was_reminded(email, day):
+                continue  # az alkalmazás vagy egy korábbi futás már elküldte
+            total += 1
+            body = render_reminder(plant_names)
+            yield (email, day, body), email, subject, body
 
-    emails = get_all_user_emails()
-    if not emails:
-        print("Nincsenek felhasználói email címek.")
+    sent = 0
+    try:
+        if connections > 1:
+            # asyncio: több SMTP kapcsolat egyszerre, a levelek körbejárási ideje átfed
+            sent = asyncio.run(_send_concurrently(messages(), live, sender_email, sender_password, connections))
+        else:
+            for key, error in send_batch(messages(), sender_email, sender_password,
+                                         SMTP_SERVER, SMTP_PORT, SMTP_USE_SSL,
+                                         SMTP_RATE_PER_SECOND):
+                sent += _report(live, key, error)
+    finally:
+        repository.close()
+        live.close()
+
+    return {
+        "shard": shard_index,
+        "users": total,
+        "sent": sent,
+        "failed": total - sent,
+        "seconds": monotonic() - started,
+    }
+
+def _run_shard(args):
+    return run_shard(*args)
+
+@contextmanager
+def _reminder_database(snapshot):
+    # --snapshot: a job a SQLite adatbázis egy pillanatképét olvassa (lásd database.open_snapshot),
+    # így a hosszú olvasás nem az élő fájlon fut, és minden worker ugyanazt az állapotot látja.
+    # A küldés előtti ellenőrzés a pillanatkép mellett az élő adatbázist is nézi (run_shard),
+    # így az alkalmazás által azóta sorba tett értesítők sem mennek ki kétszer.
+    path = sqlite_path(DATABASE_URL) if snapshot else None
+    if path is None:
+        if snapshot:
+            print("PostgreSQL háttérnél nincs pillanatkép, a job az adatbázist olvassa (MVCC).")
+        yield DATABASE_URL
         return
+    with open_snapshot(path) as snapshot_path:
+        yield snapshot_path
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Napi öntözési emlékeztető emailek küldése.")
+    parser.add_argument("--shards", type=int, default=1,
+                        help="ennyi szeletre osztjuk a felhasználókat (pl. ennyi párhuzamos job fut)")
+    parser.add_argument("--shard-index", type=int, default=0,
+                        help="ez a futás melyik szeletet dolgozza fel (0-tól számozva)")
+    parser.add_argument("--workers", type=int, default=1,
+                        help="ennyi folyamat osztozik a szeleten, mindegyik saját SMTP kapcsolattal")
+    parser.add_argument("--connections", type=int, default=1,
+                        help="ennyi SMTP kapcsolat küld párhuzamosan folyamatonként (asyncio)")
+    parser.add_argument("--snapshot", action="store_true",
+                        help="az élő SQLite fájl helyett egy pillanatképből olvas (sqlite3 backup)")
+    parser.add_argument("--force", action="store_true",
+                        help="a helyi időtől függetlenül mindenkinek küld, aki ma még nem kapott (kézi indítás, mérés)")
+    args = parser.parse_args(argv)
+    if args.shards < 1 or args.workers < 1 or args.connections < 1:
+        parser.error("a --shards, a --workers és a --connections értéke legalább 1 kell legyen")
+    if not 0 <= args.shard_index < args.shards:
+        parser.error("a --shard-index értéke 0 és --shards - 1 közé kell essen")
+    return args
 
-    body = "Ma még öntözni kell ezeken a növényeken:\n" + \
-           "\n".join([f"- {p[2]} (tulajdonos: {p[1]})" for p in not_watered])
-    subject = "Növény öntözési emlékeztető"
+def main(argv=None):
+    args = parse_args(argv)
+    now = datetime.now(timezone.utc)
+    not_before = None if args.force else REMINDER_TIME
 
     sender_email = os.environ.get("EMAIL_ADDRESS")
     sender_password = os.environ.get("EMAIL_PASSWORD")
 
-    if not sender_email or not sender_password:
+    if not sender_email or (SMTP_USE_SSL and not sender_password):
         print("Hiányzó SMTP hitelesítő adatok az EMAIL_ADDRESS vagy EMAIL_PASSWORD környezeti változóban.")
         return
 
-    send_email(emails, subject, body, sender_email, sender_password)
-    print("Értesítő email elküldve.")
+    for url in {DATABASE_URL, SENT_DATABASE_URL}:
+        repository = open_repository(url)
+        try:
+            repository.init_schema()
+        finally:
+            repository.close()
+
+    # A --shards szeletet tovább bontjuk a workerek között: shards * workers alszelet,
+    # ebből ez a futás a shard_index * workers ... + workers - 1 tartományt kapja
+    shard_count = args.shards * args.workers
+    started = monotonic()
+    with _reminder_database(args.snapshot) as database_url:
+        jobs = [
+            (now, shard_count, args.shard_index * args.workers + worker,
+             sender_email, sender_password, args.connections, not_before, database_url)
+            for worker in range(args.workers)
+        ]
+        if args.workers == 1:
+            results = [run_shard(*jobs[0])]
+        else:
+            # a megnyitott SQLite kapcsolatok nem vihetők át új folyamatba
+            close_all_connections()
+            with multiprocessing.get_context("spawn").Pool(args.workers) as pool:
+                results = pool.map(_run_shard, jobs)
+    elapsed = monotonic() - started
+
+    total = sum(r["users"] for r in results)
+    if not total:
+        print("Nincs most értesítendő felhasználó (nincs öntözendő növény, még nincs itt az idő, "
+              "vagy ma már mindenki megkapta az értesítőt).")
+        return
+
+    if len(results) > 1:
+        for r in results:
+            print(f"  szelet {r['shard']}: {r['sent']}/{r['users']} elküldve, "
+                  f"{r['failed']} hiba, {r['seconds']:.1f} s")
+    sent = sum(r["sent"] for r in results)
+    failed = sum(r["failed"] for r in results)
+    print(f"Értesítő email elküldve {sent}/{total} felhasználónak "
+          f"({failed} hiba, {elapsed:.1f} s).")
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    try:
+        main()
+    finally:
+        # több workernél csak ennek a folyamatnak a hívásai (séma, összesítés) kerülnek bele
+        if METRICS_FILE:
+            write_prometheus()
@@ -0,0 +1,84 @@
+import argparse
+import socketserver
+import threading
+import time
+
+# Helyi SMTP szerver teszteléshez és méréshez: minden parancsra 250-et válaszol, a
+# leveleket nem továbbítja, csak megszámolja. A latency a valódi szerverek levelenkénti
+# válaszidejét utánozza, így látszik, mennyit gyorsít a párhuzamos kézbesítés.
+#   python smtp_sink.py --port 8025 --latency 0.05
+#   SMTP_SERVER=localhost SMTP_PORT=8025 SMTP_USE_SSL=0 EMAIL_ADDRESS=teszt@example.com \
+#       python send_reminder.py --force --connections 8
+
+class _Handler(socketserver.StreamRequestHandler):
+    def handle(self):
+        self.wfile.write(b"220 smtp-sink\r\n")
+        recipients = []
+        for line in self.rfile:
+            command = line[:4].upper()
+            if command == b"QUIT":
+                self.wfile.write(b"221 Bye\r\n")
+                return
+            if command == b"RCPT":
+                recipients.append(line.split(b":", 1)[1].strip(b" <>\r\n").decode())
+            elif command == b"DATA":
+                self.wfile.write(b"354 End data with <CR><LF>.<CR><LF>\r\n")
+                for data in self.rfile:
+                    if data == b".\r\n":
+                        break
+                if self.server.latency:
+                    time.sleep(self.server.latency)
+                self.server.add(recipients)
+                recipients = []
+            elif command == b"RSET":
+                recipients = []
+            self.wfile.write(b"250 OK\r\n")
+
+class SmtpSink(socketserver.ThreadingTCPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self, host="127.0.0.1", port=0, latency=0.0):
+        super().__init__((host, port), _Handler)
+        self.latency = latency
+        self.received = 0
+        self.recipients = []
+        self._lock = threading.Lock()
+
+    @property
+    def port(self):
+        return self.server_address[1]
+
+    def add(self, recipients):
+        with self._lock:
+            self.received += 1
+            self.recipients.extend(recipients)
+
+    def start(self):
+        # Háttérszálon fut; port=0 esetén a kapott port a .port-ban van
+        threading.Thread(target=self.serve_forever, name="smtp-sink", daemon=True).start()
+        return self
+
+    def stop(self):
+        self.shutdown()
+        self.server_close()
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Helyi SMTP szerver, ami csak megszámolja a leveleket.")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8025)
+    parser.add_argument("--latency", type=float, default=0.0, help="válaszidő levelenként (másodperc)")
+    args = parser.parse_args(argv)
+
+    sink = SmtpSink(args.host, args.port, args.latency)
+    print(f"SMTP szerver: {args.host}:{sink.port} (Ctrl+C a leállításhoz)")
+    try:
+        sink.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        sink.server_close()
+        print(f"{sink.received} levél érkezett.")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,75 @@
+import argparse
+import os
+import subprocess
+import sys
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+
+# Indulási profil a `python -X importtime` kimenetéből. Minden mérés friss
+# interpreterben fut, így a hideg indulás importköltségét látjuk:
+#   python startup_profile.py                 (app_logic, ahogy az app.py betölti)
+#   python startup_profile.py app --runs 10   (a teljes Streamlit szkript importjai)
+
+# Ezeket a modulokat az app_logic csak első használatkor tölti be
+LAZY_MODULES = [
+    "smtplib", "email.mime.text", "hashlib", "gzip", "csv",
+    "mailer", "passwords", "retention", "analytics", "plant_import", "due_scheduler",
+    "streamlit_cookies_manager",
+]
+
+def importtime(module, python=sys.executable):
+    # Egy import mérése: [(saját µs, összesített µs, modul, mélység)] a betöltés sorrendjében
+    result = subprocess.run(
+        [python, "-X", "importtime", "-c", f"import {module}"],
+        capture_output=True, text=True, cwd=BASE_DIR,
+    )
+    if result.returncode != 0:
+        raise RuntimeError(result.stderr.strip().splitlines()[-1])
+    entries = []
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        self_us, cumulative_us, name = line[len("import time:"):].split("|", 2)
+        name = name[1:]
+        depth = (len(name) - len(name.lstrip())) // 2
+        entries.append((int(self_us), int(cumulative_us), name.strip(), depth))
+    return entries
+
+def profile(module, runs=5):
+    # A leggyorsabb futást adjuk vissza, az kevésbé zajos (lemez cache, ütemező)
+    best = None
+    for _ in range(runs):
+        entries = importtime(module)
+        total = sum(self_us for self_us, _, _, _ in entries)
+        if best is None or total < best[0]:
+            best = (total, entries)
+    return best
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Indulási importidő mérése (python -X importtime).")
+    parser.add_argument("module", nargs="?", default="app_logic", help="a mért modul (alapból app_logic)")
+    parser.add_argument("--runs", type=int, default=5, help="ennyi friss interpreterben mérünk")
+    parser.add_argument("--top", type=int, default=15, help="a legdrágább ennyi közvetlen import listázása")
+    args = parser.parse_args(argv)
+
+    try:
+        total, entries = profile(args.module, args.runs)
+    except RuntimeError as e:
+        print(f"A(z) {args.module} importja nem sikerült: {e}")
+        return 1
+
+    print(f"{args.module}: {total / 1000:.1f} ms importidő, {len(entries)} modul "
+          f"(legjobb {args.runs} futásból)")
+
+    print("\nLegdrágább közvetlen importok (mélység <= 1):")
+    shallow = sorted((e for e in entries if e[3] <= 1), key=lambda e: e[1], reverse=True)
+    for self_us, cumulative_us, name, depth in shallow[:args.top]:
+        print(f"  {cumulative_us / 1000:8.1f} ms  {'  ' * depth}{name}")
+
+    loaded = {name for _, _, name, _ in entries}
+    eager = [name for name in LAZY_MODULES if name in loaded]
+    print("\nIndításkor betöltött, lustán is betölthető modulok: " + (", ".join(eager) or "nincs"))
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,139 @@
+import argparse
+import multiprocessing
+import os
+import random
+import sqlite3
+import sys
+import threading
+from time import perf_counter
+
+import database
+from benchmark import BASE_DIR, generate, _summary
+from database import close_all_connections, get_connection
+
+# Párhuzamos írási terhelés az öntözés útvonalán (plants frissítés, napló bejegyzés és
+# összesítők egy BEGIN IMMEDIATE tranzakcióban, lásd database.write_transaction):
+#   python stress_write.py                            (16 szál, szálanként 200 öntözés)
+#   python stress_write.py --threads 16 --processes 4 (4 folyamat, mindegyikben 16 szál)
+# A végén ellenőrzi, hogy minden sikeres öntözés pontosan egy napló bejegyzést és egy
+# watering_stats növelést hagyott, és hogy egyetlen "database is locked" hiba sem volt;
+# ha bármelyik nem teljesül, 1-es kóddal lép ki. Az adatbázis (bench/stress/plants.db)
+# minden futás előtt újragenerálódik.
+
+def _hammer(workdir, thread_count, waterings, plant_count, seed):
+    # Egy folyamat terhelése: thread_count szál, mindegyik waterings öntözést indít véletlen
+    # növényekre. Visszaad: (sikeres öntözések, hibaüzenetek, öntözésenkénti idők)
+    os.chdir(workdir)
+    lock = threading.Lock()
+    done = []
+    errors = []
+    timings = []
+
+    def worker(index):
+        rng = random.Random(seed * 1000 + index)
+        own_timings = []
+        own_errors = []
+        for _ in range(waterings):
+            plant_id = rng.randint(1, plant_count)
+            started = perf_counter()
+            try:
+                database.update_last_watered_and_log(plant_id, f"stress{seed}-{index}")
+            except sqlite3.Error as e:
+                own_errors.append(str(e))
+                continue
+            own_timings.append(perf_counter() - started)
+        with lock:
+            done.append(len(own_timings))
+            errors.extend(own_errors)
+            timings.extend(own_timings)
+
+    threads = [threading.Thread(target=worker, args=(index,)) for index in range(thread_count)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    close_all_connections()
+    return sum(done), errors, timings
+
+def _run_process(args):
+    return _hammer(*args)
+
+def _counts():
+    with get_connection() as conn:
+        logs = conn.execute("SELECT COUNT(*) FROM watering_logs").fetchone()[0]
+        stats = conn.execute("SELECT COALESCE(SUM(waterings), 0) FROM watering_stats").fetchone()[0]
+        # növények, ahol az összesítő eltér a napló tényleges bejegyzésszámától
+        mismatched = conn.execute("""
+            SELECT COUNT(*) FROM plants p
+            LEFT JOIN watering_stats s ON s.plant_id = p.id
+            WHERE COALESCE(s.waterings, 0) != (SELECT COUNT(*) FROM watering_logs WHERE plant_id = p.id)
+        """).fetchone()[0]
+    return logs, stats, mismatched
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Párhuzamos öntözések az adatbázis írási útvonalán.")
+    parser.add_argument("--threads", type=int, default=16, help="szálak száma folyamatonként")
+    parser.add_argument("--processes", type=int, default=1, help="ennyi folyamat ír egyszerre")
+    parser.add_argument("--waterings", type=int, default=200, help="öntözések száma szálanként")
+    parser.add_argument("--users", type=int, default=100)
+    parser.add_argument("--plants-per-user", type=int, default=10)
+    args = parser.parse_args(argv)
+    if args.threads < 1 or args.processes < 1 or args.waterings < 1:
+        parser.error("a --threads, a --processes és a --waterings értéke legalább 1 kell legyen")
+
+    workdir = os.path.join(BASE_DIR, "bench", "stress")
+    os.makedirs(workdir, exist_ok=True)
+    cwd = os.getcwd()
+    os.chdir(workdir)
+    try:
+        close_all_connections()
+        db_path = os.path.join(workdir, database.DB_NAME)
+        for suffix in ("", "-wal", "-shm"):
+            if os.path.exists(db_path + suffix):
+                os.remove(db_path + suffix)
+        plant_count, _ = generate(db_path, args.users, args.plants_per_user, years=0.1)
+        logs_before, stats_before, _ = _counts()
+
+        jobs = [(workdir, args.threads, args.waterings, plant_count, seed) for seed in range(args.processes)]
+        started = perf_counter()
+        if args.processes == 1:
+            results = [_hammer(*jobs[0])]
+        else:
+            # a megnyitott SQLite kapcsolatok nem vihetők át új folyamatba
+            close_all_connections()
+            with multiprocessing.get_context("spawn").Pool(args.processes) as pool:
+                results = pool.map(_run_process, jobs)
+        elapsed = perf_counter() - started
+
+        logs, stats, mismatched = _counts()
+    finally:
+        close_all_connections()
+        os.chdir(cwd)
+
+    issued = args.processes * args.threads * args.waterings
+    succeeded = sum(result[0] for result in results)
+    errors = [error for result in results for error in result[1]]
+    locked = sum("locked" in error for error in errors)
+    timing = _summary([t for result in results for t in result[2]] or [0.0])
+    print(f"{args.processes} folyamat x {args.threads} szál: {succeeded}/{issued} öntözés "
+          f"{elapsed:.1f} s alatt ({succeeded / elapsed:.0f} / s)")
+    print(f"  öntözésenként: átlag {timing['mean_ms']:.1f} ms, p95 {timing['p95_ms']:.1f} ms, "
+          f"max {timing['max_ms']:.1f} ms")
+    print(f"  új napló bejegyzés: {logs - logs_before}, watering_stats növekedés: {stats - stats_before}, "
+          f"eltérő növény: {mismatched}")
+
+    failures = []
+    if errors:
+        failures.append(f"{len(errors)} hiba, ebből {locked} 'database is locked' (első: {errors[0]})")
+    if logs - logs_before != issued:
+        failures.append(f"a napló {logs - logs_before} új bejegyzést tartalmaz {issued} öntözésre")
+    if stats - stats_before != issued:
+        failures.append(f"a watering_stats {stats - stats_before}-tel nőtt {issued} öntözésre")
+    if mismatched:
+        failures.append(f"{mismatched} növénynél a watering_stats eltér a naplótól")
+    for failure in failures:
+        print(f"HIBA: {failure}")
+    return 1 if failures else 0
+
+if __name__ == "__main__":
+    sys.exit(main())